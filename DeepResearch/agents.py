@@ -1,44 +1,113 @@
+import asyncio
 import os
-import random
-from langchain_openai import ChatOpenAI
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_tavily import TavilySearch
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from clients import client_pool, key_fingerprint
+from followup import FOLLOWUP, FOLLOWUP_HEURISTICS, classify, previous_turn, terms
+from history import node_history
+from llm_cache import CacheMiss, cache_only, get_response_cache
+from scheduler import ScheduledClient, call_scheduler
+from search_cache import CachedSearchClient, normalize_query
+from telemetry import in_context, record, span, token_usage_handler
+from tokens import count_tokens
 
 # Remove global LLM init
 # llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
 
+# The provider SDKs (langchain_openai, langchain_tavily) and numpy are
+# imported on first use: they are most of the import time of this module,
+# and the app should be able to render before any of them is needed.
+
 # Tools
-def get_tavily_tool():
-    api_key = os.getenv("TAVILY_API_KEY")
-    if not api_key:
-        raise RuntimeError("TAVILY_API_KEY is not set")
-    limit = random.randint(5, 10)
+def build_tavily_tool(api_key, max_results, base_url=None):
+    from langchain_tavily import TavilySearch
+
+    # TavilySearch only builds its own API wrapper when api_base_url is passed
+    extra = {"api_base_url": base_url} if base_url else {}
     return TavilySearch(
-        max_results=limit,
-        tavily_api_key=api_key
+        max_results=max_results,
+        tavily_api_key=api_key,
+        **extra
     )
 
+# TavilySearch fixes max_results when it is built, so there is one pooled
+# tool per result count (see RESULT_SIZES)
+DEFAULT_MAX_RESULTS = 5
+
+def get_tavily_tool(config=None, max_results=DEFAULT_MAX_RESULTS):
+    configurable = (config or {}).get('configurable', {})
+    api_key = configurable.get('tavily_api_key') or os.getenv("TAVILY_API_KEY")
+    if not api_key:
+        raise RuntimeError("TAVILY_API_KEY is not set")
+    # Point at a Tavily-compatible endpoint (e.g. a local stub) when set
+    base_url = configurable.get('tavily_base_url') or os.getenv("TAVILY_API_BASE_URL")
+    key = ("tavily", key_fingerprint(api_key), base_url, max_results)
+    return client_pool.get(key, lambda: build_tavily_tool(api_key, max_results, base_url))
+
 # Helper to get LLM
-def get_llm(config):
-    api_key = config.get('configurable', {}).get('openai_api_key')
+LLM_MODEL = "gpt-4o-mini"
+LLM_MAX_TOKENS = 1000
+
+def build_llm(api_key, base_url=None):
+    # temperature=0 makes responses deterministic, so identical prompts are
+    # answered from the shared response cache instead of a new API call
+    # Retries are left to the call scheduler, which also rate-limits per key
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=LLM_MODEL, temperature=0, openai_api_key=api_key, base_url=base_url, max_tokens=LLM_MAX_TOKENS, cache=get_response_cache(), max_retries=0, callbacks=[token_usage_handler])
+
+def get_openai_key(config):
+    configurable = config.get('configurable', {})
+    api_key = configurable.get('openai_api_key')
     # fallback to env var if not in config
     if not api_key:
         api_key = os.environ.get("OPENAI_API_KEY")
     
     if not api_key:
         raise ValueError("OpenAI API Key not found. Please set it in the sidebar.")
+    return api_key
+
+def get_llm(config):
+    configurable = config.get('configurable', {})
+    api_key = get_openai_key(config)
         
-    base_url = None
-    if api_key.startswith("sk-or-v1"):
+    # Any OpenAI-compatible endpoint (LM Studio, Ollama, a local stub) can be configured
+    base_url = configurable.get('openai_base_url') or os.environ.get("OPENAI_BASE_URL")
+    if not base_url and api_key.startswith("sk-or-v1"):
         base_url = "https://openrouter.ai/api/v1"
         
-    return ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=api_key, base_url=base_url, max_tokens=1000)
+    # Reuse one client (and its warm HTTP connections) per key/endpoint/model
+    key = ("openai", key_fingerprint(api_key), base_url, LLM_MODEL, LLM_MAX_TOKENS)
+    return client_pool.get(key, lambda: build_llm(api_key, base_url))
+
+# LLM calls go through the shared scheduler: token-bucket rate limiting per
+# API key, jittered retries on 429/5xx and a circuit breaker. The response
+# cache is tried first on its own, so cached answers take no rate tokens.
+def call_llm(config, fn, *args):
+    key = key_fingerprint(get_openai_key(config))
+    try:
+        with cache_only():
+            return fn(*args)
+    except CacheMiss:
+        return call_scheduler.call("openai", fn, *args, key=key)
+
+async def acall_llm(config, fn, *args):
+    key = key_fingerprint(get_openai_key(config))
+    try:
+        with cache_only():
+            return await fn(*args)
+    except CacheMiss:
+        return await call_scheduler.acall("openai", fn, *args, key=key)
+
+# Each node has a sync and an async variant sharing the same prompts, so the
+# graph serves both graph.invoke/stream and graph.ainvoke/astream
 
 # --- Planner Agent ---
-def planner_node(state, config):
+def get_planner_chain(config):
     llm = get_llm(config)
     search_focus = config.get('configurable', {}).get('search_focus', 'Academic Research Paper')
     
@@ -53,81 +122,517 @@ def planner_node(state, config):
         ("human", "{query}")
     ])
     
-    planner_chain = planner_prompt | llm | StrOutputParser()
-    
+    return planner_prompt | llm | StrOutputParser()
+
+# Numbered plan lines become the steps the research loop has to cover;
+# bullets are used only when the plan has no numbered lines
+MAX_PLAN_STEPS = 8
+_PLAN_NUMBERED = re.compile(r"^\d+[.)]\s+")
+_PLAN_BULLET = re.compile(r"^[-*•]\s+")
+
+def parse_plan_steps(plan, limit=MAX_PLAN_STEPS):
+    lines = [line.strip() for line in plan.splitlines()]
+    marker = _PLAN_NUMBERED if any(_PLAN_NUMBERED.match(line) for line in lines) else _PLAN_BULLET
+    steps = []
+    for line in lines:
+        if not marker.match(line):
+            continue
+        step = re.sub(r"[*_#`]", "", marker.sub("", line)).strip(" :")
+        if step and step not in steps:
+            steps.append(step[:120])
+    return steps[:limit]
+
+def plan_update(query, plan, started):
+    # Starts this turn's research loop (see assess_node)
+    return {"plan": plan, "steps": parse_plan_steps(plan) or [query], "current_step": 0,
+            "gaps": [], "assessed": 0, "started": started}
+
+def planner_node(state, config):
+    started = time.time()
     query = state['query']
-    chat_history = state.get('chat_history', [])
-    plan = planner_chain.invoke({"query": query, "chat_history": chat_history})
-    return {"plan": plan, "steps": [], "current_step": 0}
+    chat_history = node_history(state, "planner")
+    plan = call_llm(config, get_planner_chain(config).invoke, {"query": query, "chat_history": chat_history})
+    return plan_update(query, plan, started)
 
-# --- Searcher Agent ---
-def searcher_node(state, config):
-    plan = state['plan']
+async def aplanner_node(state, config):
+    started = time.time()
     query = state['query']
+    chat_history = node_history(state, "planner")
+    plan = await acall_llm(config, get_planner_chain(config).ainvoke, {"query": query, "chat_history": chat_history})
+    return plan_update(query, plan, started)
+
+# --- Searcher Agent ---
+# Defaults for the fan-out search; each can be overridden via config["configurable"]
+DEFAULT_MAX_SUB_QUERIES = 4
+DEFAULT_SEARCH_CONCURRENCY = 4
+DEFAULT_SEARCH_TIMEOUT = 30  # seconds per query
+
+def parse_sub_queries(text, limit):
+    # One query per line; drop bullets/numbering the LLM may add anyway
+    queries = []
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*• ").strip()
+        # Only a list marker: "5G rollout" and "2024 results" keep their digits
+        line = _PLAN_NUMBERED.sub("", line).strip('"')
+        if line and line not in queries:
+            queries.append(line)
+    return queries[:limit]
+
+def format_search_results(search_query, results):
+    # Check if results is a list (standard output), a dict with "results", or string (error)
+    if isinstance(results, dict):
+        results = results.get("results", results)
+    if isinstance(results, list):
+        body = "\n".join([f"Source: {r.get('url', 'N/A')}\nContent: {r.get('content', 'N/A')}" for r in results])
+    else:
+        body = str(results)
+    return f"Search Query: {search_query}\n{body}"
+
+def run_searches(search, queries, concurrency, timeout):
+    # Run every query on a bounded pool. Queries run in waves of `concurrency`,
+    # so the whole batch gets `timeout` per wave before stragglers are dropped.
+    workers = max(1, min(concurrency, len(queries)))
+    waves = -(-len(queries) // workers)
+    deadline = time.monotonic() + timeout * waves
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    futures = [executor.submit(in_context(search), q) for q in queries]
+    contents = []
+    try:
+        for q, future in zip(queries, futures):
+            try:
+                results = future.result(timeout=max(0, deadline - time.monotonic()))
+                contents.append(format_search_results(q, results))
+            except FuturesTimeout:
+                contents.append(f"Search Query: {q}\nSearch timed out after {timeout}s")
+            except Exception as e:
+                contents.append(f"Search Query: {q}\nSearch failed: {e}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return contents
+
+async def arun_searches(search, queries, concurrency, timeout):
+    # Async counterpart of run_searches: a semaphore bounds concurrency and
+    # each query gets its own timeout once it starts
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(q):
+        async with semaphore:
+            try:
+                results = await asyncio.wait_for(search(q), timeout)
+                return format_search_results(q, results)
+            except asyncio.TimeoutError:
+                return f"Search Query: {q}\nSearch timed out after {timeout}s"
+            except Exception as e:
+                return f"Search Query: {q}\nSearch failed: {e}"
+
+    return list(await asyncio.gather(*(run(q) for q in queries)))
+
+def get_search_settings(config):
+    configurable = config.get('configurable', {})
+    return {
+        "search_focus": configurable.get('search_focus', 'Academic Research Paper'),
+        "max_queries": int(configurable.get('max_sub_queries', DEFAULT_MAX_SUB_QUERIES)),
+        "concurrency": int(configurable.get('search_concurrency', DEFAULT_SEARCH_CONCURRENCY)),
+        "timeout": float(configurable.get('search_timeout', DEFAULT_SEARCH_TIMEOUT)),
+        "local_index": bool(configurable.get('local_index', LOCAL_INDEX)),
+        # Whose private sources (uploaded PDFs) the local index may return
+        "owner": configurable.get('owner_id', ""),
+    }
+
+# --- Local source index (see vector_index.py) ---
+# Queries the local corpus already covers are answered from it; the rest go
+# to Tavily, and whatever comes back is indexed for later requests
+LOCAL_INDEX = os.getenv("LOCAL_INDEX", "1") != "0"
+LOCAL_RESULTS = 5
+
+def split_local(queries, settings):
+    # (contents answered from the local index, queries that still need a web search)
+    if not settings["local_index"]:
+        return [], queries
+    from vector_index import get_source_index
+
+    index = get_source_index()
+    contents, remaining = [], []
+    for q in queries:
+        hits = index.lookup(q, LOCAL_RESULTS, owner=settings.get("owner", ""))
+        if hits is None:
+            remaining.append(q)
+        else:
+            contents.append(format_search_results(f"{q} (local index)", hits))
+    record(index_hits=len(contents))
+    return contents, remaining
+
+def indexed(search, settings):
+    if not settings["local_index"]:
+        return search
+    from vector_index import get_source_index
+    def run(q):
+        results = search(q)
+        get_source_index().add_results(results)
+        return results
+    return run
+
+def aindexed(search, settings):
+    if not settings["local_index"]:
+        return search
+    from vector_index import get_source_index
+    async def run(q):
+        results = await search(q)
+        # Disk and lock waits, off the event loop
+        await asyncio.to_thread(lambda: get_source_index().add_results(results))
+        return results
+    return run
+
+# Searches are idempotent, so a slow one is hedged with a second request
+SEARCH_HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", 5))
+
+def get_search_tool(config, search_focus, max_results=DEFAULT_MAX_RESULTS):
+    # Cache outermost so cache hits never wait on the rate limiter
+    tool = get_tavily_tool(config, max_results)
+    api_key = config.get('configurable', {}).get('tavily_api_key') or os.getenv("TAVILY_API_KEY")
+    scheduled = ScheduledClient(tool, "tavily", key=key_fingerprint(api_key), hedge_after=SEARCH_HEDGE_AFTER)
+    return CachedSearchClient(scheduled, search_focus=search_focus)
+
+# --- Result sizing ---
+# The result count and Tavily search depth of a query follow from the query
+# itself and the search focus, so the same query always sends the same
+# request (and hits the search cache). Short lookups get a small page; a page
+# whose relevant results do not cover the query is fetched once more at the
+# next size. config["configurable"]["max_results"] pins one size instead.
+RESULT_SIZES = (3, 5, 8)
+# Content terms (see followup.terms) of a simple and of a complex query
+SIMPLE_QUERY_TERMS = 3
+COMPLEX_QUERY_TERMS = 8
+COMPLEX_CUES = (
+    "compare", "comparison", " vs ", " vs. ", "versus", "difference", "trade-off", "tradeoff", "pros and cons",
+    "advantages", "why ", "how does", "how do", "impact of", "relationship", "survey", "state of the art",
+)
+# A page is enough with this many relevant results that cover the query's terms
+MIN_RELEVANT_RESULTS = 2
+MIN_RESULT_SCORE = 0.5
+MIN_QUERY_COVERAGE = 0.6
+
+def query_terms(query):
+    # Search operators (site:arxiv.org, OR) say nothing about the topic
+    return set(terms(re.sub(r"\b\w+:\S+", " ", query)))
+
+def result_level(query):
+    # Index into RESULT_SIZES: term count, bumped by comparative/causal cues
+    count = len(query_terms(query))
+    level = 0 if count <= SIMPLE_QUERY_TERMS else 2 if count >= COMPLEX_QUERY_TERMS else 1
+    text = " " + re.sub(r"\s+", " ", query.lower()) + " "
+    if any(cue in text for cue in COMPLEX_CUES):
+        level += 1
+    return min(level, len(RESULT_SIZES) - 1)
+
+def result_pages(query, search_focus, max_results=None):
+    # [(search_depth, max_results)] to try in order. Complex queries, and
+    # academic ones beyond a simple lookup, use the advanced depth.
+    if max_results:
+        return [(None, int(max_results))]
+    level = result_level(query)
+    pages = []
+    for size_level in range(level, min(level + 2, len(RESULT_SIZES))):
+        advanced = size_level == len(RESULT_SIZES) - 1 or (search_focus == "Academic Research Paper" and size_level > 0)
+        pages.append(("advanced" if advanced else "basic", RESULT_SIZES[size_level]))
+    return pages
+
+def page_sufficient(query, results):
+    if isinstance(results, dict):
+        results = results.get("results", results)
+    if not isinstance(results, list):
+        # Errors are not retried with more results
+        return True
+    relevant = [r for r in results if isinstance(r, dict) and (r.get("score") or 0) >= MIN_RESULT_SCORE]
+    wanted, found = query_terms(query), set()
+    for r in relevant:
+        found.update(terms(f"{r.get('title', '')} {r.get('content', '')}"))
+    coverage = len(wanted & found) / len(wanted) if wanted else 1.0
+    return len(relevant) >= MIN_RELEVANT_RESULTS and coverage >= MIN_QUERY_COVERAGE
+
+def sized_search(config, search_focus):
+    # search(q) for run_searches; building the first tool up front makes a
+    # missing API key fail before any query is sent
+    get_search_tool(config, search_focus)
+    fixed = config.get('configurable', {}).get('max_results')
+    def run(q):
+        pages = result_pages(q, search_focus, fixed)
+        for depth, size in pages:
+            request = {"query": q, "search_depth": depth} if depth else {"query": q}
+            results = get_search_tool(config, search_focus, size).invoke(request)
+            if page_sufficient(q, results):
+                break
+        return results
+    return run
+
+def asized_search(config, search_focus):
+    get_search_tool(config, search_focus)
+    fixed = config.get('configurable', {}).get('max_results')
+    async def run(q):
+        pages = result_pages(q, search_focus, fixed)
+        for depth, size in pages:
+            request = {"query": q, "search_depth": depth} if depth else {"query": q}
+            results = await get_search_tool(config, search_focus, size).ainvoke(request)
+            if page_sufficient(q, results):
+                break
+        return results
+    return run
+
+def get_query_chain(config, settings):
     llm = get_llm(config)
-    search_focus = config.get('configurable', {}).get('search_focus', 'Academic Research Paper')
-    
-    if search_focus == "Academic Research Paper":
+    if settings["search_focus"] == "Academic Research Paper":
         focus_instr = "scientific research papers and academic sources (e.g., adds 'site:arxiv.org OR site:sciencedirect.com' or keywords like 'research paper', 'pdf')"
     else:
         focus_instr = "general web results, blogs, and articles to provide a comprehensive public overview"
 
-    # We can ask the LLM to generate a search query based on the plan
+    # Ask the LLM for one search query per plan step in a single call
     search_query_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"You are a search query generator. Based on the research plan and the original query, generate the next best search query to find {focus_instr}. Output ONLY the search query."),
-        ("human", "Query: {query}\nPlan: {plan}\n\nGenerate search query:")
+        ("system", f"You are a search query generator. Based on the research plan and the original query, generate up to {settings['max_queries']} distinct search queries, one per plan step, to find {focus_instr}. Output ONLY the search queries, one per line, without numbering."),
+        ("human", "Query: {query}\nPlan: {plan}\n\nGenerate search queries:")
     ])
     
-    chain = search_query_prompt | llm | StrOutputParser()
-    
-    def generate_query():
-        return chain.invoke({"query": query, "plan": plan})
-        
-    search_query = generate_query()
+    return search_query_prompt | llm | StrOutputParser()
+
+def select_sub_queries(text, query, limit, searched=()):
+    # The raw query (searched by prefetch_node) and queries of earlier rounds
+    # are not searched again
+    done = {normalize_query(q) for q in (query, *searched)}
+    return [q for q in parse_sub_queries(text, limit + len(done)) if normalize_query(q) not in done][:limit]
+
+def next_round(state, config):
+    # Plan text for the query generator and the search settings of this
+    # round: the whole plan first, later rounds only the steps still
+    # uncovered, with no more queries than the search budget has left
+    settings = get_search_settings(config)
+    searches_left = get_research_budget(config)["search_budget"] - len(state.get('searched') or [])
+    settings["max_queries"] = max(1, min(settings["max_queries"], searches_left))
+    if not state.get('current_step'):
+        return state['plan'], settings
+    gaps = "\n".join(f"- {step}" for step in state.get('gaps', []))
+    return f"Steps the results so far do not cover (search for these only):\n{gaps}", settings
+
+def searcher_node(state, config):
+    query = state['query']
+    plan, settings = next_round(state, config)
+    text = call_llm(config, get_query_chain(config, settings).invoke, {"query": query, "plan": plan})
+    sub_queries = select_sub_queries(text, query, settings["max_queries"], state.get('searched') or [])
+    # Each pass is one round of the research loop
+    update = {"searched": sub_queries, "current_step": state.get('current_step', 0) + 1}
+    contents, sub_queries = split_local(sub_queries, settings)
+    if not sub_queries:
+        return {"content": contents, **update}
     
-    # Execute search
+    # Execute searches concurrently
     try:
-        tool = get_tavily_tool()
-        results = tool.invoke(search_query)
-        # Check if results is a list (standard output) or string (error)
-        if isinstance(results, list):
-             content = "\n".join([f"Source: {r.get('url', 'N/A')}\nContent: {r.get('content', 'N/A')}" for r in results])
-        else:
-             content = str(results)
+        search = sized_search(config, settings["search_focus"])
     except Exception as e:
-        content = f"Search failed: {e}"
+        return {"content": contents + [f"Search failed: {e}"], **update}
+    contents += run_searches(indexed(search, settings), sub_queries, settings["concurrency"], settings["timeout"])
     
-    return {"content": [content]} # Append to content list
+    return {"content": contents, **update} # Append to content list
 
-# --- Writer Agent ---
-def writer_node(state, config):
-    llm = get_llm(config)
+async def asearcher_node(state, config):
     query = state['query']
-    chat_history = state.get('chat_history', [])
-    content = "\n\n".join(state.get('content', []))
+    plan, settings = next_round(state, config)
+    text = await acall_llm(config, get_query_chain(config, settings).ainvoke, {"query": query, "plan": plan})
+    sub_queries = select_sub_queries(text, query, settings["max_queries"], state.get('searched') or [])
+    update = {"searched": sub_queries, "current_step": state.get('current_step', 0) + 1}
+    contents, sub_queries = await asyncio.to_thread(split_local, sub_queries, settings)
+    if not sub_queries:
+        return {"content": contents, **update}
     
-    # Determine if references should be included
-    # Rule: Include if first message OR if it's a completely new topic.
-    # We'll use the LLM to decide if it's a "fresh topic" vs "follow-up"
-    include_refs = True
-    if len(chat_history) > 0:
-        decision_prompt = f"Analyze the following query in the context of the conversation. Is this a 'fresh topic' or a 'follow-up' on the previous research? \nQuery: {query}\nAnswer with only 'fresh' or 'follow-up'."
-        decision = llm.invoke(decision_prompt).content.strip().lower()
-        if "follow-up" in decision:
-            include_refs = False
-
-    ref_instruction = ""
-    if include_refs:
-        ref_instruction = "\n\nIMPORTANT: At the end of your response, you MUST provide a section titled '## References' with a bulleted list of at least 5 URLs/Sources you used from the search results."
-    else:
-        ref_instruction = "\n\nIMPORTANT: Do NOT include a '## References' section. This is a follow-up inquiry; focus solely on the analysis/methodology asked."
+    try:
+        search = asized_search(config, settings["search_focus"])
+    except Exception as e:
+        return {"content": contents + [f"Search failed: {e}"], **update}
+    contents += await arun_searches(aindexed(search, settings), sub_queries, settings["concurrency"], settings["timeout"])
+    
+    return {"content": contents, **update}
+
+# --- Prefetch Search ---
+# Searches the raw query in parallel with the planner, so the writer has
+# results for it without waiting on the plan
+def prefetch_node(state, config):
+    settings = get_search_settings(config)
+    searched = [state['query']]
+    contents, queries = split_local(searched, settings)
+    if not queries:
+        return {"content": contents, "searched": searched}
+    try:
+        search = sized_search(config, settings["search_focus"])
+    except Exception as e:
+        return {"content": [f"Search failed: {e}"], "searched": searched}
+    return {"content": run_searches(indexed(search, settings), queries, 1, settings["timeout"]), "searched": searched}
+
+async def aprefetch_node(state, config):
+    settings = get_search_settings(config)
+    searched = [state['query']]
+    contents, queries = await asyncio.to_thread(split_local, searched, settings)
+    if not queries:
+        return {"content": contents, "searched": searched}
+    try:
+        search = asized_search(config, settings["search_focus"])
+    except Exception as e:
+        return {"content": [f"Search failed: {e}"], "searched": searched}
+    return {"content": await arun_searches(aindexed(search, settings), queries, 1, settings["timeout"]), "searched": searched}
+
+# --- Research loop ---
+# After every search round the assess node checks which plan steps the
+# results cover; uncovered steps get another round until they are covered,
+# a round adds too little that is new, or a budget runs out. The budgets
+# (research rounds, wall-clock seconds since planning started, tokens of
+# search results handed to the writer, search queries) come in tiers that
+# trade depth for latency; each can be overridden via config["configurable"].
+RESEARCH_TIERS = {
+    "quick": {"max_rounds": 1, "time_budget": 20.0, "token_budget": 6000, "search_budget": 5, "min_gain": 0.2},
+    "standard": {"max_rounds": 3, "time_budget": 60.0, "token_budget": 16000, "search_budget": 12, "min_gain": 0.1},
+    "deep": {"max_rounds": 5, "time_budget": 180.0, "token_budget": 40000, "search_budget": 30, "min_gain": 0.05},
+}
+RESEARCH_DEPTH = os.getenv("RESEARCH_DEPTH", "standard")
+# A plan step counts as covered once this share of its terms is in the results
+STEP_COVERAGE = 0.5
+# Plan wording that says what to do rather than what to find
+PLAN_STOPWORDS = frozenset("""
+identify review analyze analyse gather compile summarize summarise search find collect examine evaluate compare
+define determine investigate explore understand assess synthesize outline list look discus highlight conduct
+key relevant recent current main major source information data overview step topic finding conclusion report
+literature background context aspect area
+""".split())
 
+def get_research_budget(config):
+    configurable = config.get('configurable', {})
+    tier = RESEARCH_TIERS.get(configurable.get('research_depth', RESEARCH_DEPTH), RESEARCH_TIERS["standard"])
+    return {name: type(default)(configurable.get(name, default)) for name, default in tier.items()}
+
+def result_terms(contents):
+    # Terms of the search results, without the "Search Query:" header lines,
+    # so a query never counts as covering its own topic
+    found = set()
+    for entry in contents:
+        found.update(terms(entry.split("\n", 1)[1] if entry.startswith("Search Query:") and "\n" in entry else entry))
+    return found
+
+def step_covered(step, found):
+    wanted = set(terms(step)) - PLAN_STOPWORDS
+    return not wanted or len(wanted & found) / len(wanted) >= STEP_COVERAGE
+
+def stop_reason(state, budget, gaps, gain, tokens):
+    # Why the loop should stop now, or None to search again
+    rounds = state.get('current_step', 0)
+    elapsed = time.time() - state.get('started', time.time())
+    if not gaps:
+        return "covered"
+    if rounds >= budget["max_rounds"]:
+        return "rounds"
+    if gain < budget["min_gain"]:
+        return "gain"
+    # Stop if another round as long as the average one would overrun
+    if elapsed + elapsed / max(rounds, 1) > budget["time_budget"]:
+        return "time"
+    if tokens >= budget["token_budget"]:
+        return "tokens"
+    if len(state.get('searched') or []) >= budget["search_budget"]:
+        return "searches"
+    return None
+
+def assess_node(state, config):
+    budget = get_research_budget(config)
+    content = state.get('content') or []
+    assessed = state.get('assessed', 0)
+    earlier, found = result_terms(content[:assessed]), result_terms(content)
+    # Marginal information: share of all terms found so far that the latest round added
+    gain = len(found - earlier) / len(found) if found else 0.0
+    gaps = [step for step in state.get('steps', []) if not step_covered(step, found)]
+    reason = stop_reason(state, budget, gaps, gain, count_tokens("\n\n".join(content)))
+    return {"assessed": len(content), "gaps": [] if reason else gaps, "research_stop": reason or ""}
+
+async def aassess_node(state, config):
+    # Local and CPU-only, like the sync version
+    return assess_node(state, config)
+
+def route_research(state):
+    # After assess: another search round while there are gaps to fill
+    return "searcher" if state.get('gaps') else "writer"
+
+# --- Writer Agent ---
+# Tag on the writer chain so streaming UIs can pick out the answer tokens
+WRITER_STREAM_TAG = "writer_output"
+
+REFS_INSTRUCTION = "\n\nIMPORTANT: At the end of your response, you MUST provide a section titled '## References' with a bulleted list of at least 5 URLs/Sources you used from the search results."
+NO_REFS_INSTRUCTION = "\n\nIMPORTANT: Do NOT include a '## References' section. This is a follow-up inquiry; focus solely on the analysis/methodology asked."
+
+# Determine if references should be included
+# Rule: Include if first message OR if it's a completely new topic.
+# followup.py decides locally in well under a millisecond; only ambiguous
+# queries ask the LLM whether this is a "fresh topic" or a "follow-up", and
+# that call overlaps with assembling the writer prompt
+def get_decision_prompt(query, previous_query=""):
+    previous = f"\nPrevious question: {previous_query}" if previous_query else ""
+    return f"Analyze the following query in the context of the conversation. Is this a 'fresh topic' or a 'follow-up' on the previous research?{previous}\nQuery: {query}\nAnswer with only 'fresh' or 'follow-up'."
+
+def is_follow_up(state):
+    # (follow_up, previous query); follow_up is None when the LLM has to decide
+    if not (state.get('chat_history') or state.get('history_summary')):
+        return False, ""
+    previous_query, previous_response = previous_turn(state.get('chat_history', []), state.get('history_summary', ""))
+    if not FOLLOWUP_HEURISTICS:
+        return None, previous_query
+    with span("classifier"):
+        decision = classify(state['query'], previous_query, previous_response)
+    return (None if decision is None else decision == FOLLOWUP), previous_query
+
+def llm_follow_up(config, llm, query, previous_query):
+    with span("classifier_llm"):
+        decision = call_llm(config, llm.invoke, get_decision_prompt(query, previous_query)).content.strip().lower()
+    return "follow-up" in decision
+
+async def allm_follow_up(config, llm, query, previous_query):
+    with span("classifier_llm"):
+        decision = (await acall_llm(config, llm.ainvoke, get_decision_prompt(query, previous_query))).content.strip().lower()
+    return "follow-up" in decision
+
+# One LLM fallback per writer at most, so a small shared pool is enough
+_classifier_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="classifier")
+
+def get_writer_chain(llm, include_refs):
+    ref_instruction = REFS_INSTRUCTION if include_refs else NO_REFS_INSTRUCTION
     writer_prompt = ChatPromptTemplate.from_messages([
         ("system", f"You are a research writer. Synthesize the gathered information to answer the user's query. Incorporate the search results into a cohesive response.{ref_instruction}"),
         ("placeholder", "{chat_history}"),
         ("human", "Query: {query}\n\nSearch Results:\n{content}\n\nProvide a comprehensive answer:")
     ])
     
-    writer_chain = writer_prompt | llm | StrOutputParser()
-    response = writer_chain.invoke({"query": query, "content": content, "chat_history": chat_history})
-    return {"response": response}
+    return (writer_prompt | llm | StrOutputParser()).with_config(tags=[WRITER_STREAM_TAG])
+
+def writer_node(state, config):
+    llm = get_llm(config)
+    query = state['query']
+    follow_up, previous_query = is_follow_up(state)
+    pending = None
+    if follow_up is None:
+        pending = _classifier_executor.submit(in_context(llm_follow_up), config, llm, query, previous_query)
+    chat_history = node_history(state, "writer")
+    content = "\n\n".join(state.get('content', []))
+    if pending is not None:
+        follow_up = pending.result()
+
+    writer_chain = get_writer_chain(llm, include_refs=not follow_up)
+    response = call_llm(config, writer_chain.invoke, {"query": query, "content": content, "chat_history": chat_history})
+    # Clear the search results so the next turn on this thread starts fresh
+    return {"response": response, "content": None, "searched": None}
+
+async def awriter_node(state, config):
+    llm = get_llm(config)
+    query = state['query']
+    follow_up, previous_query = is_follow_up(state)
+    pending = None
+    if follow_up is None:
+        pending = asyncio.create_task(allm_follow_up(config, llm, query, previous_query))
+    chat_history = node_history(state, "writer")
+    content = "\n\n".join(state.get('content', []))
+    if pending is not None:
+        follow_up = await pending
+
+    writer_chain = get_writer_chain(llm, include_refs=not follow_up)
+    response = await acall_llm(config, writer_chain.ainvoke, {"query": query, "content": content, "chat_history": chat_history})
+    return {"response": response, "content": None, "searched": None}
@@ -2,9 +2,12 @@ import streamlit as st
 import os
 import uuid
 import datetime
+import time
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage
-from graph import graph
+from history import RollingSummary
+from chat_store import get_chat_store
+from telemetry import span, tracing
 # Load environment variables
 load_dotenv()
 # Page config
@@ -56,20 +59,104 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
-# --- Session State Initialization ---
-if "chats" not in st.session_state:
-    # Structure: {chat_id: {"title": "...", "messages": [], "created_at": ...}}
-    new_chat_id = str(uuid.uuid4())
-    st.session_state.chats = {
-        new_chat_id: {
-            "title": "New Chat",
-            "messages": [],
-            "created_at": datetime.datetime.now()
+# Progress labels shown while a research run streams
+STAGE_LABELS = {
+    "planner": "📝 Research plan ready",
+    "prefetch": "⚡ Initial search complete",
+    "searcher": "🔍 Search complete",
+    "assess": "🧭 Coverage checked",
+    "writer": "✍️ Answer written",
+}
+# Keep the traces of this many recent requests per session
+MAX_TRACES = 20
+# Sidebar chats per page, and messages shown before "Show earlier messages"
+CHATS_PER_PAGE = 20
+MESSAGES_PER_PAGE = 20
+# The research graph pulls in langgraph and the LLM/search SDKs. It is loaded
+# on the first request rather than at startup, so the page renders first, and
+# cache_resource keeps it for the life of the process across reruns and
+# sessions.
+@st.cache_resource(show_spinner="Loading research agents...")
+def load_research_graph():
+    import graph
+    graph.get_graph()
+    return graph
+# Deleting a chat only needs the checkpointer, not the compiled graph; it is
+# the same instance the graph uses (see checkpoint.get_checkpointer)
+@st.cache_resource
+def load_checkpointer():
+    from checkpoint import get_checkpointer
+    return get_checkpointer()
+def render_trace(panel):
+    # Per-stage timings and counters of the latest request, slowest stage first
+    traces = st.session_state.get("traces", [])
+    with panel.container():
+        with st.expander("⏱️ Request Trace", expanded=False):
+            if not traces:
+                st.caption("No requests traced yet.")
+                return
+            trace = traces[-1]
+            st.caption(f"\"{trace['query'][:60]}\" • {trace['seconds']:.1f}s total")
+            spans = sorted(trace["spans"], key=lambda s: s["seconds"], reverse=True)
+            slowest = next((s for s in spans if s["parent"] is None), spans[0])
+            st.caption(f"Slowest stage: **{slowest['span']}** ({slowest['seconds']:.2f}s)")
+            st.dataframe([{
+                "stage": s["span"] if s["parent"] is None else f"{s['parent']} › {s['span']}",
+                "seconds": s["seconds"],
+                "llm calls": s["llm_calls"],
+                "tokens in": s["prompt_tokens"],
+                "tokens out": s["completion_tokens"],
+                "searches": s["search_calls"],
+                "search s": s["search_seconds"],
+                "cache hits": s["llm_cache_hits"] + s["search_cache_hits"] + s["index_hits"],
+                "KB": round((s["search_bytes"] + s["output_bytes"]) / 1024, 1),
+            } for s in spans], hide_index=True)
+def load_chat(chat):
+    # Messages and rolling summary of the open chat, read from the store only
+    # when switching chats; other chats stay on disk
+    loaded = st.session_state.get("loaded_chat")
+    if loaded is None or loaded["id"] != chat["id"]:
+        loaded = {
+            "id": chat["id"],
+            "messages": chat_store.load_messages(chat["id"]),
+            "history": RollingSummary(summary=chat["summary"], summarized=chat["summarized"]),
+            "shown": MESSAGES_PER_PAGE,
         }
-    }
-    st.session_state.current_chat_id = new_chat_id
+        st.session_state.loaded_chat = loaded
+    return loaded
+def render_message(message):
+    # Header and body in a single markdown block
+    timestamp = message.additional_kwargs.get("timestamp", "")
+    author = "You" if isinstance(message, HumanMessage) else "Assistant"
+    body = f":gray[**{author}** • *{timestamp}*]\n\n{message.content}" if timestamp else message.content
+    with st.chat_message("user" if isinstance(message, HumanMessage) else "assistant"):
+        st.markdown(body)
+def show_earlier(loaded_chat):
+    loaded_chat["shown"] += MESSAGES_PER_PAGE
+@st.fragment
+def render_transcript(loaded_chat):
+    # Only the latest messages; a fragment, so "Show earlier messages" reruns
+    # just the transcript instead of the sidebar and the whole page
+    messages = loaded_chat["messages"]
+    shown = loaded_chat["shown"]
+    if len(messages) > shown:
+        st.button(f"Show earlier messages ({len(messages) - shown} more)", key="show_earlier",
+                  on_click=show_earlier, args=(loaded_chat,))
+    for message in messages[-shown:]:
+        render_message(message)
+# --- Session State Initialization ---
+# Chats are kept in the chat store (chat_store.py). The session holds only
+# the open chat; its owner id is kept in the URL so reloads and restarts
+# find the same chats again. That id is the only access control, so anyone
+# with the URL sees these chats.
+chat_store = get_chat_store()
+if "owner_id" not in st.session_state:
+    st.session_state.owner_id = st.query_params.get("session") or str(uuid.uuid4())
+    st.query_params["session"] = st.session_state.owner_id
+owner_id = st.session_state.owner_id
 if "current_chat_id" not in st.session_state:
-    st.session_state.current_chat_id = list(st.session_state.chats.keys())[0]
+    latest = chat_store.list_chats(owner_id, limit=1)
+    st.session_state.current_chat_id = latest[0]["id"] if latest else chat_store.create_chat(owner_id)
 # --- Sidebar ---
 with st.sidebar:
     st.title("Research Assistant")
@@ -99,19 +186,41 @@ with st.sidebar:
         index=1, # Default to Academic
         label_visibility="collapsed"
     )
+    # Research depth: more search rounds and larger budgets take longer
+    research_depth = st.select_slider(
+        "Research depth",
+        options=["quick", "standard", "deep"],
+        value="standard",
+        help="Quick: one search round. Standard: up to 3 rounds within a minute. Deep: up to 5 rounds within 3 minutes."
+    )
     st.divider()
     # Chat List
     st.subheader("Chats")
-    chat_ids = list(st.session_state.chats.keys())
-    # Sort by creation time desc
-    chat_ids.sort(key=lambda x: st.session_state.chats[x]["created_at"], reverse=True)
+    # Titles only, one page at a time and newest first; messages are loaded
+    # for the open chat alone
+    def reset_chat_page():
+        st.session_state.chat_page = 0
+    chat_search = st.text_input(
+        "Search chats",
+        key="chat_search",
+        placeholder="🔎 Search chats",
+        label_visibility="collapsed",
+        on_change=reset_chat_page
+    )
+    chat_count = chat_store.count_chats(owner_id, chat_search)
+    page_count = max(1, -(-chat_count // CHATS_PER_PAGE))
+    chat_page = min(st.session_state.get("chat_page", 0), page_count - 1)
+    st.session_state.chat_page = chat_page
+    chats = chat_store.list_chats(owner_id, limit=CHATS_PER_PAGE, offset=chat_page * CHATS_PER_PAGE, search=chat_search)
+    if chat_search and not chats:
+        st.caption("No matching chats.")
     
     # Scrollable container for chats (implicit in Streamlit sidebar)
     if "editing_chat_id" not in st.session_state:
         st.session_state.editing_chat_id = None
 
-    for c_id in chat_ids:
-        chat = st.session_state.chats[c_id]
+    for chat in chats:
+        c_id = chat["id"]
         
         # Check if we are editing this chat
         is_editing = (st.session_state.editing_chat_id == c_id)
@@ -122,7 +231,7 @@ with st.sidebar:
                  def on_rename_submit(cid=c_id):
                       new_name = st.session_state[f"rename_input_{cid}"]
                       if new_name:
-                           st.session_state.chats[cid]["title"] = new_name
+                           chat_store.rename(cid, new_name)
                       st.session_state.editing_chat_id = None
                  
                  st.text_input(
@@ -155,31 +264,31 @@ with st.sidebar:
                       st.rerun()
             with col3:
                  if st.button("🗑️", key=f"del_{c_id}"):
-                    del st.session_state.chats[c_id]
+                    chat_store.delete_chat(c_id)
+                    load_checkpointer().delete_thread(c_id)
                     # If we deleted the current chat, switch to another
                     if c_id == st.session_state.current_chat_id:
-                        if st.session_state.chats:
-                             st.session_state.current_chat_id = list(st.session_state.chats.keys())[0]
-                        else:
-                             # No chats left, create one
-                             new_id = str(uuid.uuid4())
-                             st.session_state.chats[new_id] = {
-                                 "title": "New Chat",
-                                 "messages": [],
-                                 "created_at": datetime.datetime.now()
-                             }
-                             st.session_state.current_chat_id = new_id
+                        latest = chat_store.list_chats(owner_id, limit=1)
+                        # No chats left, create one
+                        st.session_state.current_chat_id = latest[0]["id"] if latest else chat_store.create_chat(owner_id)
                     st.rerun()
 
+    # Pager
+    if page_count > 1:
+        def turn_chat_page(step):
+            st.session_state.chat_page += step
+        col1, col2, col3 = st.columns([0.2, 0.6, 0.2])
+        with col1:
+            st.button("◀", key="chat_page_prev", disabled=chat_page == 0, on_click=turn_chat_page, args=(-1,))
+        with col2:
+            st.caption(f"Page {chat_page + 1} of {page_count} • {chat_count} chats")
+        with col3:
+            st.button("▶", key="chat_page_next", disabled=chat_page == page_count - 1, on_click=turn_chat_page, args=(1,))
+
     # Function to create new chat (for use in button)
     def create_new_chat():
-        new_id = str(uuid.uuid4())
-        st.session_state.chats[new_id] = {
-            "title": "New Chat",
-            "messages": [],
-            "created_at": datetime.datetime.now()
-        }
-        st.session_state.current_chat_id = new_id
+        st.session_state.current_chat_id = chat_store.create_chat(owner_id)
+        st.session_state.chat_page = 0
     
     # Spacer to push content to bottom
     st.markdown("---")
@@ -196,36 +305,63 @@ with st.sidebar:
         if st.button("Analyze PDF"):
             with st.spinner("Extracting and Summarizing..."):
                 try:
-                    import pypdf
+                    from pdf_cache import cached_extract_pdf, cached_summary, pdf_digest
+                    from pdf_extract import extraction_summary, join_pages
+                    from summarize import summarize_document
                     # Import get_llm instead of global llm
-                    from agents import get_llm
+                    from agents import call_llm, get_llm, LLM_MODEL
                     
                     # Create config object for get_llm
                     pdf_config = {"configurable": {"openai_api_key": openai_api_key}}
                     llm = get_llm(pdf_config)
                     
-                    # Extract Text
-                    reader = pypdf.PdfReader(uploaded_file)
-                    text = ""
-                    for page in reader.pages:
-                        text += page.extract_text() + "\n"
+                    # Extract Text (text layer first, OCR only for scanned pages),
+                    # cached by PDF hash so re-uploads and reruns skip the work
+                    pdf_bytes = uploaded_file.getvalue()
+                    page_results = cached_extract_pdf(pdf_bytes)
+                    st.caption(extraction_summary(page_results))
+                    text = join_pages(page_results)
+                    # This user's later research questions can draw on the document
+                    # too; it is private to them (see vector_index.SourceIndex)
+                    from vector_index import get_source_index
+                    get_source_index().add(text, url=uploaded_file.name, title=uploaded_file.name, source="pdf",
+                                           owner=owner_id)
                     
-                    # Truncate if too long (simple check, can be improved)
-                    if len(text) > 50000:
-                        text = text[:50000] + "...(truncated)"
-                        
-                    # Summarize
-                    summary_prompt = f"Please provide a comprehensive summary of the following text:\n\n{text}"
-                    response = llm.invoke(summary_prompt)
+                    # Summarize the whole document: chunks are summarized
+                    # concurrently, then merged hierarchically
+                    pdf_progress = st.progress(0.0, text="Summarizing...")
+                    def show_progress(stage, done, total):
+                        pdf_progress.progress(done / total, text=f"Summarizing ({stage} {done}/{total})")
+                    summary = cached_summary(
+                        pdf_digest(pdf_bytes),
+                        lambda: summarize_document(text, lambda p: call_llm(pdf_config, llm.invoke, p).content, progress=show_progress),
+                        model=LLM_MODEL, method="map-reduce",
+                    )
                     
                     # Store result in session state to display in main area
-                    st.session_state.pdf_summary = response.content
+                    st.session_state.pdf_summary = summary
                     st.success("Analysis Complete!")
                     
                 except Exception as e:
                     st.error(f"Error processing PDF: {e}")
     st.divider()
     
+    # Cache Stats
+    with st.expander("🗄️ Cache Stats", expanded=False):
+        from pdf_cache import pdf_cache_stats
+        from search_cache import get_search_cache
+        from llm_cache import get_response_cache
+        st.caption("PDF text & summaries")
+        st.json(pdf_cache_stats())
+        st.caption("Search results")
+        st.json(get_search_cache().stats.as_dict())
+        st.caption("LLM responses")
+        st.json(get_response_cache().stats.as_dict())
+    
+    # Request Trace (refreshed again once a new request finishes)
+    trace_panel = st.empty()
+    render_trace(trace_panel)
+    
     # Theme Toggle
     st.toggle("Dark Mode", value=(st.session_state.theme == "dark"), on_change=toggle_theme)
 # --- Main Chat Area ---
@@ -236,77 +372,110 @@ if "pdf_summary" in st.session_state:
         if st.button("Clear Summary"):
             del st.session_state.pdf_summary
             st.rerun()
-if st.session_state.current_chat_id in st.session_state.chats:
-    current_chat_data = st.session_state.chats[st.session_state.current_chat_id]
-    messages = current_chat_data["messages"]
+current_chat_data = chat_store.get_chat(st.session_state.current_chat_id)
+if current_chat_data is not None:
+    chat_id = current_chat_data["id"]
+    loaded_chat = load_chat(current_chat_data)
+    messages = loaded_chat["messages"]
     
     st.header(current_chat_data["title"])
-    # Display History
-    for message in messages:
-        timestamp = message.additional_kwargs.get("timestamp", "")
-        if isinstance(message, HumanMessage):
-            with st.chat_message("user"):
-                if timestamp:
-                    st.caption(f"**You** • *{timestamp}*")
-                st.markdown(message.content)
-        elif isinstance(message, AIMessage):
-            with st.chat_message("assistant"):
-                if timestamp:
-                    st.caption(f"**Assistant** • *{timestamp}*")
-                st.markdown(message.content)
+    render_transcript(loaded_chat)
     # Input
     if prompt := st.chat_input("What would you like to research?"):
         # Add user message
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        messages.append(HumanMessage(content=prompt, additional_kwargs={"timestamp": timestamp}))
-        with st.chat_message("user"):
-            st.caption(f"**You** • *{timestamp}*")
-            st.markdown(prompt)
+        messages.append(chat_store.append_message(chat_id, HumanMessage(content=prompt, additional_kwargs={"timestamp": timestamp})))
+        render_message(messages[-1])
             
         # Run Backend
         config = {
             "configurable": {
-                "thread_id": st.session_state.current_chat_id,
+                "thread_id": chat_id,
                 "openai_api_key": openai_api_key,
                 "tavily_api_key": tavily_api_key,
-                "search_focus": search_focus
+                "search_focus": search_focus,
+                "research_depth": research_depth,
+                "owner_id": owner_id
             }
         }
+        # Only the recent turns go in verbatim; older ones arrive as a rolling
+        # summary that is updated in the background after each answer
+        history = loaded_chat["history"]
+        history_summary, recent_history = history.context(messages[:-1])
+        if history.summarized != current_chat_data["summarized"]:
+            chat_store.save_summary(chat_id, history.summary, history.summarized)
         inputs = {
             "query": prompt,
-            "chat_history": messages[:-1]
+            "chat_history": recent_history,
+            "history_summary": history_summary
         }
         with st.chat_message("assistant"):
+            status = st.status("Researching...", expanded=False)
             message_placeholder = st.empty()
-            with st.spinner("Thinking..."):
-                try:
-                    final_state = graph.invoke(inputs, config=config)
-                    response_content = final_state.get("response", "No response generated.")
-                    
-                    message_placeholder.markdown(response_content)
+            try:
+                # Stream stage progress and writer tokens as they arrive
+                run_started = time.perf_counter()
+                final_state = {}
+                stage_timings = []
+                response_content = ""
+                with tracing() as trace:
+                    for event in load_research_graph().stream_research(inputs, config, trace=trace):
+                        if event[0] == "token":
+                            response_content += event[1]
+                            message_placeholder.markdown(response_content + "▌")
+                        else:
+                            _, node, seconds, update = event
+                            final_state.update(update)
+                            stage_timings.append((node, seconds))
+                            label = STAGE_LABELS.get(node, node)
+                            if node == "assess":
+                                gaps = len(update.get("gaps") or [])
+                                label += f": {gaps} plan steps left, searching again" if gaps else f": done ({update.get('research_stop')})"
+                            status.write(f"{label} ({seconds:.1f}s)")
+                total_seconds = time.perf_counter() - run_started
+                status.update(label=f"Research complete in {total_seconds:.1f}s", state="complete")
+                response_content = final_state.get("response") or response_content or "No response generated."
+                
+                message_placeholder.markdown(response_content)
+                prompt_tokens = sum(s.counters["prompt_tokens"] for s in trace.spans)
+                st.caption(" • ".join(f"{node} {seconds:.1f}s" for node, seconds in stage_timings) + f" • {prompt_tokens} prompt tokens")
+                
+                # Add assistant message
+                ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                messages.append(chat_store.append_message(chat_id, AIMessage(content=response_content, additional_kwargs={"timestamp": ts})))
+                
+                # Fold turns that left the recent window into the summary, off the critical path
+                from agents import call_llm, get_llm
+                summary_config = {"configurable": {"openai_api_key": openai_api_key}}
+                history.refresh(messages, lambda p: call_llm(summary_config, get_llm(summary_config).invoke, p).content)
+                
+                # Update title if it's the first message and still "New Chat" AFTER we get a response
+                if len(messages) == 2 and current_chat_data["title"] == "New Chat":
+                    # Generate a smart title using LLM
+                    try:
+                        from agents import call_llm, get_llm
+                        # Use a lightweight config for title generation
+                        title_config = {"configurable": {"openai_api_key": openai_api_key}}
+                        title_llm = get_llm(title_config)
+                        title_prompt = f"Generate a very short, concise 3-5 word title for this chat based on the initial user prompt: '{prompt}'. Do not use quotes."
+                        with tracing(trace=trace), span("title"):
+                            title_response = call_llm(title_config, title_llm.invoke, title_prompt)
+                        title = title_response.content.strip().replace('"', '')
+                    except Exception:
+                        # Fallback to simple split
+                        title = " ".join(prompt.split()[:5])
+                    chat_store.rename(chat_id, title)
                     
-                    # Add assistant message
-                    ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    messages.append(AIMessage(content=response_content, additional_kwargs={"timestamp": ts}))
+                    # We do NOT rerun here to avoid disrupting the flow. The title will update on next interaction.
+                
+                # Show this request's trace in the sidebar
+                traces = st.session_state.setdefault("traces", [])
+                traces.append({"query": prompt, **trace.to_dict()})
+                del traces[:-MAX_TRACES]
+                render_trace(trace_panel)
                     
-                    # Update title if it's the first message and still "New Chat" AFTER we get a response
-                    if len(messages) == 2 and current_chat_data["title"] == "New Chat":
-                        # Generate a smart title using LLM
-                        try:
-                            from agents import get_llm
-                            # Use a lightweight config for title generation
-                            title_config = {"configurable": {"openai_api_key": openai_api_key}}
-                            title_llm = get_llm(title_config)
-                            title_prompt = f"Generate a very short, concise 3-5 word title for this chat based on the initial user prompt: '{prompt}'. Do not use quotes."
-                            title_response = title_llm.invoke(title_prompt)
-                            current_chat_data["title"] = title_response.content.strip().replace('"', '')
-                        except Exception:
-                            # Fallback to simple split
-                            current_chat_data["title"] = " ".join(prompt.split()[:5])
-                        
-                        # We do NOT rerun here to avoid disrupting the flow. The title will update on next interaction.
-                        
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
+            except Exception as e:
+                status.update(label="Research failed", state="error")
+                st.error(f"An error occurred: {e}")
 else:
     st.error("No active chat. Please create a new chat.")
@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from search_cache import normalize_query
+
+# Batch research: run every query of a JSONL file through the pipeline.
+#
+#   python batch.py queries.jsonl results.jsonl --workers 8
+#
+# Input lines look like {"id": "q1", "query": "...", "search_focus": "General Web"}
+# ("id" and "search_focus" are optional). Results are appended to the output
+# file as they finish; re-running with the same output skips finished ids.
+
+
+def read_jobs(path):
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"query": record}
+            if not record.get("query"):
+                raise ValueError(f"{path}:{line_number}: missing 'query'")
+            record.setdefault("id", hashlib.sha256(record["query"].encode("utf-8")).hexdigest()[:12])
+            jobs.append(record)
+    return jobs
+
+
+def completed_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if record.get("status") == "done":
+                done.add(record["id"])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def get_runner(backend):
+    if backend == "pipeline":
+        # main.py lives one directory up
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from main import run_pipeline
+
+        return lambda job: run_pipeline(job["query"])
+
+    from graph import graph
+
+    def run(job):
+        # A fresh thread per attempt: a retry must start over, not resume the
+        # checkpoint a failed or interrupted attempt left behind
+        thread_id = f"batch-{job['id']}-{uuid.uuid4().hex[:8]}"
+        configurable = {"thread_id": thread_id}
+        if job.get("search_focus"):
+            configurable["search_focus"] = job["search_focus"]
+        try:
+            state = graph.invoke({"query": job["query"], "chat_history": []}, config={"configurable": configurable})
+        finally:
+            # Batch answers go to the output file; nothing reads the thread again
+            graph.checkpointer.delete_thread(thread_id)
+        return state.get("response", "")
+
+    return run
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_batch(input_path, output_path, workers=4, backend="graph"):
+    jobs = read_jobs(input_path)
+    done = completed_ids(output_path)
+    pending = [job for job in jobs if job["id"] not in done]
+
+    # Identical queries (after normalization) are researched once
+    groups = {}
+    for job in pending:
+        key = (normalize_query(job["query"]), job.get("search_focus"))
+        groups.setdefault(key, []).append(job)
+
+    print(f"{len(jobs)} queries, {len(done)} already done, {len(pending)} pending, {len(groups)} unique")
+    if not groups:
+        return
+
+    run = get_runner(backend)
+
+    def timed(job):
+        start = time.perf_counter()
+        return run(job), time.perf_counter() - start
+
+    latencies = []
+    failures = 0
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        if out.tell() and not _ends_with_newline(output_path):
+            out.write("\n")  # terminate a line cut short by a crash
+        futures = {pool.submit(timed, group[0]): group for group in groups.values()}
+        for finished, future in enumerate(as_completed(futures), start=1):
+            group = futures[future]
+            try:
+                response, seconds = future.result()
+                latencies.append(seconds)
+                result = {"status": "done", "response": response, "seconds": round(seconds, 3)}
+            except Exception as e:
+                failures += 1
+                result = {"status": "failed", "error": str(e)}
+            for job in group:
+                out.write(json.dumps({"id": job["id"], "query": job["query"], **result}) + "\n")
+            out.flush()
+            print(f"[{finished}/{len(groups)}] {result['status']}: {group[0]['query'][:60]}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(groups)} unique queries in {elapsed:.1f}s ({len(groups) / elapsed:.2f} queries/s), {failures} failed")
+    if latencies:
+        print(f"latency p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of research queries")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", choices=["graph", "pipeline"], default="graph",
+                        help="DeepResearch graph (OpenAI) or main.py pipeline (Gemini)")
+    args = parser.parse_args()
+    load_dotenv()
+    run_batch(args.input, args.output, args.workers, args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1076 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Offline benchmarks. Nothing here touches the network: the LLMs and search
+# are served by the stubs in stubs.py. Run from the DeepResearch directory:
+#   python benchmark.py single --requests 10
+#   python benchmark.py load --jobs 200 --concurrency 100 [--backend pipeline]
+#   python benchmark.py pdf --pages 200
+#   python benchmark.py history --turns 20
+#   python benchmark.py research --requests 20 --slow-rate 0.1 --time-budget 3
+#   python benchmark.py sizing --llm-latency 0.05 --search-latency 0.2
+#   python benchmark.py threads --threads 2000
+#   python benchmark.py followup --llm-latency 0.4
+#   python benchmark.py index --jobs 300
+#   python benchmark.py startup --runs 5
+#   python benchmark.py chats --chats 500 --messages 50 --repeat 10
+#   python benchmark.py clients
+#   python benchmark.py ocr --pages 48 --dpi 150   # OCR_BACKEND=pytesseract for the CLI engine
+#   python benchmark.py scheduler --jobs 200 --fail-rate 0.2 --slow-rate 0.05
+#
+# As a regression gate, save a baseline and compare later runs against it:
+#   python benchmark.py single --save baseline.json
+#   python benchmark.py single --baseline baseline.json   # exits 1 on a regression
+
+# name -> (value, higher_is_better), filled in by the scenarios
+RESULTS = {}
+
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(name, samples):
+    ms = sorted(s * 1000 for s in samples)
+    p95, p99 = percentile(ms, 0.95), percentile(ms, 0.99)
+    print(f"{name:<28} mean {statistics.mean(ms):8.3f} ms   p50 {statistics.median(ms):8.3f} ms   "
+          f"p95 {p95:8.3f} ms   p99 {p99:8.3f} ms")
+    RESULTS[f"{name} p50 ms"] = (statistics.median(ms), False)
+    RESULTS[f"{name} p95 ms"] = (p95, False)
+
+
+def report_value(name, value, unit, higher_is_better):
+    print(f"{name:<28} {value:10.2f} {unit}")
+    RESULTS[f"{name} {unit}"] = (value, higher_is_better)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+@contextmanager
+def track_memory(trace_heap):
+    # tracemalloc gives the peak Python heap of the scenario itself but slows
+    # allocation down, so it is opt-in (--memory); peak RSS is always reported
+    if trace_heap:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if trace_heap:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report_value("peak python heap", peak / 1024 / 1024, "MB", False)
+        rss = peak_rss_mb()
+        if rss is not None:
+            report_value("peak rss", rss, "MB", False)
+
+
+def use_temp_cache_dir():
+    # Keep benchmark runs from reading or polluting the real on-disk caches
+    os.environ["DEEPRESEARCH_CACHE_DIR"] = tempfile.mkdtemp(prefix="deepresearch-bench-")
+
+
+def unthrottle():
+    # Measure the pipeline, not the provider rate limits the scheduler enforces
+    for provider in ("OPENAI", "TAVILY", "GEMINI"):
+        os.environ.setdefault(f"{provider}_RATE", "100000")
+        os.environ.setdefault(f"{provider}_BURST", "100000")
+
+
+def stub_pipeline(args):
+    # main.py (Gemini + TavilyClient) with both services swapped for in-process
+    # fakes; main.py only builds its real clients when none are set
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main
+    from search_cache import CachedSearchClient
+    from stubs import FakeGeminiModel, FakeSearchClient
+
+    main.gemini_model = FakeGeminiModel(latency=args.llm_latency)
+    search = FakeSearchClient(latency=args.search_latency)
+    main.tavily_client = CachedSearchClient(search)
+    main.async_tavily_client = CachedSearchClient(search)
+    return main
+
+
+@contextmanager
+def quiet():
+    # main.py prints banners for every node
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def stub_config(server, thread_id, **extra):
+    return {"configurable": {
+        "thread_id": thread_id,
+        "openai_api_key": "sk-stub",
+        "tavily_api_key": "tvly-stub",
+        "openai_base_url": server.url + "/v1",
+        "tavily_base_url": server.url,
+        **extra,
+    }}
+
+
+# --- Client construction ---
+def bench_clients(args):
+    # Dummy keys: constructing clients does not touch the network
+    os.environ.setdefault("TAVILY_API_KEY", "tvly-benchmark")
+    from agents import build_llm, build_tavily_tool, get_llm, get_tavily_tool
+    from clients import client_pool
+
+    config = {"configurable": {"openai_api_key": "sk-benchmark"}}
+
+    # One research request = planner + searcher + writer + title LLMs and one search tool
+    def fresh_request():
+        for _ in range(4):
+            build_llm("sk-benchmark")
+        build_tavily_tool("tvly-benchmark", 5)
+
+    def pooled_request():
+        for _ in range(4):
+            get_llm(config)
+        get_tavily_tool()
+
+    client_pool.clear()
+    report("fresh clients / request", time_calls(fresh_request, args.repeat))
+    report("pooled clients / request", time_calls(pooled_request, args.repeat))
+    print(f"pool: {len(client_pool)} clients, {client_pool.created} created, {client_pool.reused} reused")
+    print("(fresh clients also pay a new TCP/TLS handshake on their first real API call)")
+
+
+# --- PDF OCR ---
+def make_pdf_fixture(pages, lines_per_page=40):
+    # Text-only pages; the OCR path rasterizes them like any scanned page
+    import fitz
+
+    pdf = fitz.open()
+    for page_number in range(pages):
+        page = pdf.new_page()
+        text = "\n".join(
+            f"Page {page_number + 1} line {line + 1}: the quick brown fox jumps over the lazy dog."
+            for line in range(lines_per_page)
+        )
+        page.insert_text((48, 60), text, fontsize=9)
+    data = pdf.tobytes()
+    pdf.close()
+    return data
+
+
+OCR_PROBE = """import json, resource, sys
+sys.path.insert(0, {here!r})
+from pdf_extract import iter_ocr_pages
+with open({path!r}, "rb") as f:
+    pdf_bytes = f.read()
+seconds = [s for _, _, s in iter_ocr_pages(pdf_bytes, dpi={dpi}, workers=1, backend={backend!r})]
+usage = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+print(json.dumps({{"seconds": seconds, "rss_kib": usage}}))
+"""
+
+
+def bench_ocr(args):
+    # Per-page OCR latency and peak RSS of each available engine (a fresh
+    # single-worker process each, so RSS is not shared between them), then
+    # how the default engine scales with worker processes
+    import subprocess
+    from pdf_extract import extract_text_from_pdf, ocr_backend
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    pdf_bytes = make_pdf_fixture(args.pages)
+    print(f"OCR of a generated {args.pages}-page PDF at {args.dpi} dpi")
+    backends = [b for b in ("pytesseract", "tesserocr") if ocr_backend(backend=b) == b]
+    if not backends:
+        print("no OCR engine available (install tesserocr, or pytesseract and the tesseract CLI)")
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+    try:
+        for backend in backends:
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", OCR_PROBE.format(here=here, path=f.name, dpi=args.dpi, backend=backend)],
+                                 cwd=here, capture_output=True, text=True)
+            if out.returncode:
+                raise RuntimeError(out.stderr.strip().splitlines()[-1])
+            elapsed = time.perf_counter() - start
+            probe = json.loads(out.stdout.strip().splitlines()[-1])
+            # The pytesseract engine lives in the tesseract child processes
+            python_kib, engine_kib = probe["rss_kib"]
+            report(f"{backend} per page", probe["seconds"])
+            report_value(f"{backend} pages/s", args.pages / elapsed, "pages/s", True)
+            report_value(f"{backend} peak rss", (python_kib + engine_kib) / 1024, "MB", False)
+    finally:
+        os.remove(f.name)
+
+    cpus = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+    baseline = None
+    print(f"{ocr_backend()} with worker processes (first document starts the engines, the second reuses them)")
+    for workers in worker_counts:
+        times = []
+        for _ in range(2):
+            start = time.perf_counter()
+            extract_text_from_pdf(pdf_bytes, dpi=args.dpi, workers=workers, force_ocr=True)
+            times.append(time.perf_counter() - start)
+        first, elapsed = times
+        baseline = baseline or elapsed
+        print(f"{workers:>3} workers  first {first:7.2f} s  then {elapsed:7.2f} s  {args.pages / elapsed:6.2f} pages/s  "
+              f"speedup {baseline / elapsed:4.2f}x")
+    # The fixture is born-digital, so the hybrid extractor never needs OCR
+    start = time.perf_counter()
+    extract_text_from_pdf(pdf_bytes, dpi=args.dpi)
+    print(f"text layer   {time.perf_counter() - start:7.2f} s  (hybrid extraction, no OCR)")
+
+
+# --- Single request ---
+def bench_single(args):
+    # Sequential requests, one at a time: end-to-end latency of each pipeline
+    use_temp_cache_dir()
+    unthrottle()
+    from graph import graph
+    from stubs import StubServer
+
+    print(f"{args.requests} sequential requests, stub latency llm {args.llm_latency}s / search {args.search_latency}s")
+    with StubServer(llm_latency=args.llm_latency, search_latency=args.search_latency) as server:
+        # One warm-up request loads the SDKs; cold starts are the startup scenario's job
+        graph.invoke({"query": "warm up", "chat_history": []}, config=stub_config(server, "warm-up"))
+        # Distinct queries so the response and search caches never hit
+        queries = iter(range(args.requests))
+        report("graph request", time_calls(
+            lambda: graph.invoke({"query": f"single request topic {next(queries)}", "chat_history": []},
+                                 config=stub_config(server, "single")),
+            args.requests))
+
+    main = stub_pipeline(args)
+    queries = iter(range(args.requests))
+    with quiet():
+        samples = time_calls(lambda: main.run_pipeline(f"single pipeline topic {next(queries)}"), args.requests)
+    report("pipeline request", samples)
+
+
+# --- Concurrent async load ---
+def bench_load(args):
+    use_temp_cache_dir()
+    unthrottle()
+    from stubs import StubServer
+
+    async def run_jobs(run):
+        limiter = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def job(i):
+            async with limiter:
+                start = time.perf_counter()
+                # Distinct queries so the response and search caches never hit
+                await run(i)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(job(i) for i in range(args.jobs)))
+        return time.perf_counter() - start, latencies
+
+    if args.backend == "pipeline":
+        main = stub_pipeline(args)
+        with quiet():
+            elapsed, latencies = asyncio.run(run_jobs(lambda i: main.arun_pipeline(f"load test topic {i}")))
+    else:
+        from graph import graph
+
+        with StubServer(llm_latency=args.llm_latency, search_latency=args.search_latency) as server:
+            elapsed, latencies = asyncio.run(run_jobs(lambda i: graph.ainvoke(
+                {"query": f"load test topic {i}", "chat_history": []}, config=stub_config(server, f"load-{i}"))))
+    print(f"{args.jobs} {args.backend} jobs, {args.concurrency} concurrent, "
+          f"stub latency llm {args.llm_latency}s / search {args.search_latency}s")
+    report_value("throughput", args.jobs / elapsed, "jobs/s", True)
+    report("job latency", latencies)
+
+
+# --- Iterative research loop ---
+def bench_research(args):
+    # Latency, search rounds, web searches and writer prompt size per research
+    # tier over a fixed query set. The stub plan has three steps and every
+    # round searches one query, so covering the plan takes three rounds;
+    # the tiers' budgets decide how many of them run. --time-budget overrides
+    # the wall-clock budget of every tier (e.g. with a --slow-rate tail).
+    use_temp_cache_dir()
+    unthrottle()
+    from collections import Counter
+    from graph import get_graph
+    from stubs import StubServer
+    from telemetry import tracing
+
+    graph = get_graph()
+    extra = {"max_sub_queries": 1, "local_index": False}
+    if args.time_budget is not None:
+        extra["time_budget"] = args.time_budget
+    print(f"{args.requests} queries per tier, stub latency llm {args.llm_latency}s / search {args.search_latency}s, "
+          f"{args.slow_rate:.0%} slow ({args.slow_latency}s)")
+    with StubServer(llm_latency=args.llm_latency, search_latency=args.search_latency,
+                    slow_rate=args.slow_rate, slow_latency=args.slow_latency) as server:
+        graph.invoke({"query": "warm up", "chat_history": []}, config=stub_config(server, "warm-up"))
+        for depth in ("quick", "standard", "deep"):
+            latencies, rounds, searches, writer_tokens, stops = [], [], [], [], Counter()
+            for i in range(args.requests):
+                # Distinct queries per tier so the caches never hit
+                config = stub_config(server, f"{depth}-{i}", research_depth=depth, **extra)
+                start = time.perf_counter()
+                with tracing() as trace:
+                    state = graph.invoke({"query": f"{depth} research topic {i}", "chat_history": []}, config=config)
+                latencies.append(time.perf_counter() - start)
+                rounds.append(state["current_step"])
+                searches.append(sum(s.counters["search_calls"] for s in trace.spans))
+                writer_tokens.append(sum(s.counters["prompt_tokens"] for s in trace.spans if s.name == "writer"))
+                stops[state["research_stop"]] += 1
+            report(f"{depth} latency", latencies)
+            report_value(f"{depth} rounds", statistics.mean(rounds), "rounds", True)
+            report_value(f"{depth} searches", statistics.mean(searches), "calls", False)
+            report_value(f"{depth} writer prompt", statistics.mean(writer_tokens), "tokens", False)
+            print(f"{depth} stopped by: " + ", ".join(f"{reason} {count}" for reason, count in stops.most_common()))
+
+
+# --- Search result sizing ---
+SIZING_QUERIES = [
+    ("RAG", "General Web"),
+    ("what is retrieval augmented generation", "General Web"),
+    ("transformer attention", "Academic Research Paper"),
+    ("compare LoRA vs full fine-tuning for small language models", "Academic Research Paper"),
+    ("solid state battery electrolytes", "Academic Research Paper"),
+    ("why do large language models hallucinate", "General Web"),
+    ("CRISPR off-target effects", "Academic Research Paper"),
+    ("impact of remote work on urban housing prices and commuting patterns", "General Web"),
+    ("graph neural networks", "General Web"),
+    ("pros and cons of nuclear energy versus solar for grid stability", "General Web"),
+    ("protein structure prediction accuracy", "Academic Research Paper"),
+    ("vector database indexing", "General Web"),
+]
+
+
+def bench_sizing(args):
+    # Search payload, writer prompt tokens and latency over a fixed query set:
+    # random 5-10 results per request (the previous policy, seeded) vs the
+    # query-sized policy in agents.py. Each policy runs twice; the second
+    # pass shows how many searches are answered from the search cache (the
+    # random policy draws fresh sizes, so it only hits when a draw repeats).
+    use_temp_cache_dir()
+    unthrottle()
+    import random
+    from graph import get_graph
+    from stubs import StubServer
+    from telemetry import tracing
+
+    graph = get_graph()
+    rng = random.Random(0)
+    policies = {
+        "random 5-10": lambda: {"max_results": rng.randint(5, 10)},
+        "adaptive": lambda: {},
+    }
+    print(f"{len(SIZING_QUERIES)} queries x 2 passes, stub latency llm {args.llm_latency}s / search {args.search_latency}s")
+    with StubServer(llm_latency=args.llm_latency, search_latency=args.search_latency) as server:
+        graph.invoke({"query": "warm up", "chat_history": []}, config=stub_config(server, "warm-up"))
+        for name, sizing in policies.items():
+            for run in ("first", "repeat"):
+                latencies, payload, writer_tokens, calls, hits = [], 0, 0, 0, 0
+                for i, (query, focus) in enumerate(SIZING_QUERIES):
+                    config = stub_config(server, f"{name}-{run}-{i}", search_focus=focus, local_index=False, **sizing())
+                    start = time.perf_counter()
+                    with tracing() as trace:
+                        graph.invoke({"query": query, "chat_history": []}, config=config)
+                    latencies.append(time.perf_counter() - start)
+                    payload += sum(s.counters["search_bytes"] for s in trace.spans)
+                    writer_tokens += sum(s.counters["prompt_tokens"] for s in trace.spans if s.name == "writer")
+                    calls += sum(s.counters["search_calls"] for s in trace.spans)
+                    hits += sum(s.counters["search_cache_hits"] for s in trace.spans)
+                if run == "first":
+                    report(f"{name} latency", latencies)
+                    report_value(f"{name} search payload", payload / len(SIZING_QUERIES) / 1024, "KB/query", False)
+                    report_value(f"{name} writer prompt", writer_tokens / len(SIZING_QUERIES), "tokens", False)
+                    report_value(f"{name} web searches", calls / len(SIZING_QUERIES), "calls/query", False)
+                else:
+                    report_value(f"{name} repeat cache hits", 100 * hits / max(hits + calls, 1), "%", True)
+
+
+# --- Chat history growth ---
+def bench_history(args):
+    # Prompt tokens per turn of one long chat, replaying the full transcript
+    # vs. the bounded history (recent turns + rolling summary + node budgets)
+    use_temp_cache_dir()
+    unthrottle()
+    import history
+    from agents import call_llm, get_llm
+    from graph import graph
+    from langchain_core.messages import AIMessage, HumanMessage
+    from stubs import StubServer
+    from telemetry import tracing
+
+    def run_chat(server, bounded):
+        config = stub_config(server, f"history-{bounded}")
+        memory = history.RollingSummary()
+        messages, per_turn = [], []
+        for turn in range(args.turns):
+            query = f"follow-up question {turn} on retrieval augmented generation"
+            summary, recent = memory.context(messages) if bounded else ("", messages)
+            with tracing() as trace:
+                state = graph.invoke({"query": query, "chat_history": recent, "history_summary": summary}, config=config)
+            per_turn.append(sum(span.counters["prompt_tokens"] for span in trace.spans))
+            messages += [HumanMessage(content=query), AIMessage(content=state["response"])]
+            if bounded:
+                memory.refresh(messages, lambda p: call_llm(config, get_llm(config).invoke, p).content)
+                memory.wait()  # the app does not wait; here it keeps runs repeatable
+        return per_turn
+
+    budgets = dict(history.NODE_HISTORY_TOKENS)
+    with StubServer(llm_latency=0, search_latency=0) as server:
+        history.NODE_HISTORY_TOKENS.update(dict.fromkeys(budgets, 10 ** 9))
+        try:
+            full = run_chat(server, bounded=False)
+        finally:
+            history.NODE_HISTORY_TOKENS.update(budgets)
+        bounded = run_chat(server, bounded=True)
+
+    print(f"prompt tokens per turn ({history.RECENT_TURNS} recent turns kept, budgets {budgets})")
+    print(f"{'turn':>5} {'full history':>14} {'bounded':>10}")
+    for turn, (a, b) in enumerate(zip(full, bounded), start=1):
+        print(f"{turn:>5} {a:>14} {b:>10}")
+    report_value("final turn, full history", full[-1], "prompt tokens", False)
+    report_value("final turn, bounded", bounded[-1], "prompt tokens", False)
+
+
+def bench_threads(args):
+    # Memory retained by the checkpointer after many chat threads (two turns
+    # each): the in-process MemorySaver vs the SQLite saver, plus the cost of
+    # reopening the store. The node updates of one real (stubbed) run are
+    # recorded once and replayed with update_state, so only checkpointing is
+    # measured, not the pipeline.
+    use_temp_cache_dir()
+    unthrottle()
+    import gc
+    from cache import cache_path
+    from checkpoint import SQLiteSaver
+    from graph import workflow
+    from langgraph.checkpoint.memory import MemorySaver
+    from stubs import StubServer
+
+    with StubServer(llm_latency=0, search_latency=0) as server:
+        recorder = workflow.compile(checkpointer=MemorySaver())
+        inputs = {"query": "retrieval augmented generation", "chat_history": []}
+        updates = [(node, update) for step in recorder.stream(inputs, config=stub_config(server, "record"))
+                   for node, update in step.items()]
+
+    def run_threads(saver):
+        graph = workflow.compile(checkpointer=saver)
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for i in range(args.threads):
+            config = {"configurable": {"thread_id": f"thread-{i}"}}
+            for turn in range(2):
+                config = graph.update_state(config, {**inputs, "query": f"thread {i} question {turn}"}, as_node="__start__")
+                for node, update in updates:
+                    config = graph.update_state(config, update, as_node=node)
+        elapsed = time.perf_counter() - start
+        del graph
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return retained, elapsed
+
+    path = cache_path("checkpoints-bench.sqlite3")
+    memory_retained, memory_seconds = run_threads(MemorySaver())
+    sqlite_retained, sqlite_seconds = run_threads(SQLiteSaver(path))
+    disk = sum(os.path.getsize(f) for f in (path, path + "-wal") if os.path.exists(f))
+
+    print(f"{args.threads} threads x 2 turns, {len(updates)} node updates per turn")
+    print(f"MemorySaver   {memory_seconds:6.2f} s")
+    print(f"SQLiteSaver   {sqlite_seconds:6.2f} s   {disk / 1024 / 1024:.1f} MB on disk")
+    report_value("memory saver heap growth", memory_retained / 1024 / 1024, "MB", False)
+    report_value("sqlite saver heap growth", sqlite_retained / 1024 / 1024, "MB", False)
+    report_value("sqlite disk per thread", disk / args.threads / 1024, "KB", False)
+
+    # A restart only opens the file; a thread is read when it is next used
+    start = time.perf_counter()
+    graph = workflow.compile(checkpointer=SQLiteSaver(path))
+    state = graph.get_state({"configurable": {"thread_id": "thread-0"}})
+    report_value("reopen + load one thread", (time.perf_counter() - start) * 1000, "ms", False)
+    assert state.values["query"] == "thread 0 question 1"
+
+
+# Previous answers as the writer produces them: a few hundred words with
+# headings and references. Long answers mention many common words in
+# passing, which is what the classifier has to see past.
+FOLLOWUP_ANSWERS = {
+    "What is retrieval augmented generation?": """## Overview
+Retrieval augmented generation (RAG) pairs a language model with a retriever. Before the model answers, the
+retriever searches a document index for passages related to the question, and those passages are added to the
+prompt, so the generator can ground its answer in current sources instead of relying only on what it memorized
+during training.
+
+## How the retriever works
+Documents are split into chunks and embedded into vectors. At query time the question is embedded the same way
+and the retriever returns the nearest chunks, often combined with keyword (BM25) search and a reranker that
+scores each candidate passage against the question. The quality of the retrieved passages largely decides the
+quality of the final answer.
+
+## Benefits
+- Answers can cite their sources, which makes them easier to verify.
+- The document index can be updated without retraining the model.
+- Hallucinations drop when the relevant facts are in the context.
+
+## Open challenges
+Retrieval can miss relevant passages or return near-duplicates, long contexts raise cost and latency, and the
+model may still ignore or misread the retrieved evidence. Evaluation of RAG systems is an active research area,
+with studies measuring both retrieval recall and the faithfulness of the generated answer.
+
+## References
+1. Lewis et al., Retrieval-Augmented Generation for Knowledge-Intensive NLP Tasks (2020)
+2. Gao et al., Retrieval-Augmented Generation for Large Language Models: A Survey (2023)""",
+    "Explain transformer attention": """## Overview
+Attention lets each token in a sequence look at every other token and decide how much of each to use. Every token
+is projected into a query, a key and a value vector. The attention weight between two tokens is the similarity of
+one token's query with the other's key, scaled and passed through a softmax, and the output is the weighted sum
+of the value vectors.
+
+## Multi-head attention
+Instead of a single attention function, the transformer runs several attention heads in parallel, each with its
+own projections. Different heads learn to track different relations, such as nearby words, syntax or long-range
+references, and their outputs are concatenated and projected back to the model dimension.
+
+## Why it matters
+- Every token attends to every other token in one step, so long-range dependencies are easy to model.
+- The computation is highly parallel, which made training large models on GPUs practical.
+- The cost grows quadratically with sequence length, which motivates efficient attention variants.
+
+## Current research
+Work on sparse, linear and flash attention reduces the memory and time cost for long inputs, while studies of
+attention heads try to explain what individual heads learn.
+
+## References
+1. Vaswani et al., Attention Is All You Need (2017)
+2. Dao et al., FlashAttention: Fast and Memory-Efficient Exact Attention (2022)""",
+    "Summarize the paper 'Attention Is All You Need'": """## Summary
+The 2017 paper by Vaswani and colleagues at Google introduces the Transformer, a sequence-to-sequence
+architecture built entirely on attention, without recurrence or convolution. The encoder and decoder are stacks
+of layers that combine multi-head self-attention with position-wise feed-forward networks, residual connections
+and layer normalization. Positional encodings based on sine and cosine functions give the model information about
+token order.
+
+## Results
+On the WMT 2014 English-to-German translation task the Transformer reached 28.4 BLEU, better than the previous
+best models including ensembles, and on English-to-French it set a new single-model state of the art, while
+training in a fraction of the time on eight GPUs.
+
+## Contributions
+- Self-attention replaces recurrence, so training parallelizes across the sequence.
+- Multi-head attention lets the model attend to information from different representation subspaces.
+- The architecture generalizes beyond translation, as the authors show on English constituency parsing.
+
+## Impact
+The Transformer became the basis of BERT, GPT and most current large language models, and of vision and
+speech models as well.
+
+## References
+1. Vaswani et al., Attention Is All You Need, NeurIPS (2017)""",
+    "Latest research on CRISPR gene editing": """## Overview
+CRISPR-Cas9 cuts DNA at a site chosen by a guide RNA, and the cell's repair of that break disrupts or rewrites
+the gene. Recent research has focused on making edits more precise and safer.
+
+## Base editing and prime editing
+Base editors fuse a disabled Cas9 to an enzyme that chemically converts one DNA letter into another without
+cutting both strands. Prime editing goes further: a Cas9 nickase fused to a reverse transcriptase writes a new
+sequence, carried on an extended guide RNA, directly into the target site. Prime editing can make all twelve
+single-letter substitutions as well as small insertions and deletions.
+
+## Clinical progress
+The first CRISPR therapy, for sickle cell disease and beta thalassemia, was approved in 2023. Clinical trials
+are testing in vivo editing in the liver to lower cholesterol, and base editing for blood disorders.
+
+## Safety
+- Off-target edits at sites similar to the target remain a concern, and new Cas variants reduce them.
+- Delivery into the right tissue, usually with lipid nanoparticles or viral vectors, is still a major hurdle.
+- Large deletions and immune responses to Cas proteins are being studied in current trials.
+
+## References
+1. Anzalone et al., Search-and-replace genome editing without double-strand breaks (2019)
+2. Komor et al., Programmable editing of a target base in genomic DNA (2016)""",
+    "Impact of microplastics on marine life": """## Overview
+Microplastics are plastic particles smaller than five millimetres, released by the breakdown of larger debris,
+synthetic textiles and tyre wear. They are now found from surface waters to deep-sea sediments.
+
+## Effects on marine organisms
+Plankton, shellfish and fish ingest microplastics, mistaking them for food. Laboratory studies report reduced
+feeding, slower growth, inflammation and reproductive effects, and particles can carry adsorbed pollutants such as
+PCBs into the animals that eat them. Filter feeders like mussels and oysters accumulate particularly high loads.
+
+## Food chain
+Because predators eat contaminated prey, microplastics and associated chemicals move up the food chain, reaching
+larger fish, seabirds and marine mammals. Seafood is one route of human exposure, although the health effects for
+people are still uncertain.
+
+## Research gaps
+- Field concentrations are often lower than those used in laboratory experiments.
+- Nanoplastics are hard to measure, and their effects are poorly understood.
+- Long-term, ecosystem-level impact is difficult to separate from other stressors such as warming.
+
+## References
+1. Wright et al., The physical impacts of microplastics on marine organisms: A review (2013)
+2. GESAMP, Sources, fate and effects of microplastics in the marine environment (2016)""",
+    "How do solid state batteries work?": """## Overview
+Solid-state batteries replace the liquid electrolyte of a conventional lithium-ion cell with a solid electrolyte,
+typically a ceramic such as a sulfide or oxide, or a solid polymer. Lithium ions move through the solid
+electrolyte between the cathode and the anode during charging and discharging, just as they move through the
+liquid in current cells.
+
+## Advantages
+- A solid electrolyte is not flammable, which improves safety.
+- It can allow a lithium-metal anode, raising energy density by up to fifty percent, which matters for electric
+  vehicle range.
+- Some designs promise faster charging and a longer cycle life.
+
+## Challenges
+Keeping good contact between the solid electrolyte and the electrodes is hard, because the materials expand and
+contract during cycling. Lithium dendrites can still grow through cracks, and sulfide electrolytes are sensitive
+to moisture. The effects of pressure and temperature on performance are an active area of study, and high
+sensitivity to manufacturing defects keeps costs high. Mining and refining enough lithium is a further economic
+and environmental concern.
+
+## Current state of research
+Toyota, QuantumScape and Samsung have demonstrated prototype cells, and several manufacturers in Asia, the US and
+Europe plan pilot production lines, supported by government policy and research funding. Most analysts expect
+solid-state batteries in premium electric vehicles first, later this decade.
+
+## References
+1. Janek and Zeier, A solid future for battery development, Nature Energy (2016)
+2. Manthiram et al., Lithium battery chemistries enabled by solid-state electrolytes (2017)""",
+}
+
+# (previous question, previous answer, query, is follow-up)
+FOLLOWUP_CASES = [(previous, FOLLOWUP_ANSWERS[previous], query, label) for previous, query, label in [
+    ("What is retrieval augmented generation?", "How does the retriever pick documents?", True),
+    ("What is retrieval augmented generation?", "Can you elaborate on that?", True),
+    ("What is retrieval augmented generation?", "What are its main limitations?", True),
+    ("What is retrieval augmented generation?", "Give an example", True),
+    ("Explain transformer attention", "Why multiple heads instead of one?", True),
+    ("Explain transformer attention", "Compare that with recurrent networks", True),
+    ("Summarize the paper 'Attention Is All You Need'", "What methodology did the authors use for evaluation?", True),
+    ("Latest research on CRISPR gene editing", "How accurate is prime editing?", True),
+    ("Latest research on CRISPR gene editing", "Tell me more about the off-target effects", True),
+    ("Impact of microplastics on marine life", "Which fish species are most affected?", True),
+    ("Impact of microplastics on marine life", "And what about freshwater ecosystems?", True),
+    ("How do solid state batteries work?", "What are the manufacturing challenges of these batteries?", True),
+    ("What is retrieval augmented generation?", "Latest advances in quantum error correction codes", False),
+    ("What is retrieval augmented generation?", "New topic: history of the Byzantine empire", False),
+    ("Explain transformer attention", "Effects of intermittent fasting on insulin sensitivity in adults", False),
+    ("Latest research on CRISPR gene editing", "How do central banks set interest rates during inflation?", False),
+    ("Impact of microplastics on marine life", "Switching to something else: best practices for Kubernetes autoscaling", False),
+    ("How do solid state batteries work?", "Survey of graph neural networks for drug discovery", False),
+    ("Summarize the paper 'Attention Is All You Need'", "Climate change impact on coffee crop yields in Brazil", False),
+    ("Impact of microplastics on marine life", "What is the current state of fusion energy research?", False),
+    ("Explain transformer attention", "Compare the economic policies of Keynes and Hayek", False),
+    ("How do solid state batteries work?", "Who invented the printing press and when?", False),
+    ("How do solid state batteries work?", "Effects of intermittent fasting on insulin sensitivity in adults", False),
+    ("How do solid state batteries work?", "What is the current state of fusion energy research?", False),
+    ("How do solid state batteries work?", "Health effects of air pollution from mining", False),
+    ("How do solid state batteries work?", "Economic impact of electric vehicle policy in Europe", False),
+]]
+
+
+def bench_followup(args):
+    # The writer's follow-up check on the labelled FOLLOWUP_CASES: the local
+    # classifier vs the LLM round-trip it replaces (stub LLM at --llm-latency)
+    use_temp_cache_dir()
+    unthrottle()
+    import agents
+    from followup import FOLLOWUP, classify
+    from llm_cache import get_response_cache
+    from langchain_core.messages import AIMessage, HumanMessage
+    from stubs import StubServer
+
+    decisions = [classify(query, prev_q, prev_a) for prev_q, prev_a, query, _ in FOLLOWUP_CASES]
+    decided = [(d == FOLLOWUP, case[3]) for d, case in zip(decisions, FOLLOWUP_CASES) if d is not None]
+    local = time_calls(lambda: [classify(q, pq, pa) for pq, pa, q, _ in FOLLOWUP_CASES], args.repeat)
+    report("local classifier (per query)", [t / len(FOLLOWUP_CASES) for t in local])
+    report_value("decided locally", len(decided) / len(FOLLOWUP_CASES) * 100, "%", True)
+    report_value("local accuracy", sum(a == b for a, b in decided) / max(len(decided), 1) * 100, "%", True)
+
+    # Time spent in the writer before its own LLM call starts, per follow-up turn
+    with StubServer(llm_latency=args.llm_latency, search_latency=0) as server:
+        config = stub_config(server, "followup")
+        llm = agents.get_llm(config)
+
+        def decide(prev_q, prev_a, query):
+            state = {"query": query, "chat_history": [HumanMessage(content=prev_q), AIMessage(content=prev_a)]}
+            follow_up, previous_query = agents.is_follow_up(state)
+            if follow_up is None:
+                follow_up = agents.llm_follow_up(config, llm, query, previous_query)
+            return follow_up
+
+        means = {}
+        for heuristics in (False, True):
+            agents.FOLLOWUP_HEURISTICS = heuristics
+            samples = []
+            for _ in range(max(1, args.repeat // len(FOLLOWUP_CASES))):
+                for prev_q, prev_a, query, _ in FOLLOWUP_CASES:
+                    get_response_cache().clear()  # every decision pays its LLM call
+                    start = time.perf_counter()
+                    decide(prev_q, prev_a, query)
+                    samples.append(time.perf_counter() - start)
+            report("decision, " + ("heuristic + fallback" if heuristics else "llm only"), samples)
+            means[heuristics] = statistics.mean(samples)
+    report_value("removed per follow-up turn", (means[False] - means[True]) * 1000, "ms", True)
+
+
+# Synthetic research domains for the index scenario: topic -> vocabulary
+INDEX_TOPICS = {
+    "retrieval augmented generation": "retriever generator passages dense sparse reranking chunking grounding hallucination context",
+    "quantum error correction": "qubits surface code stabilizer logical decoherence threshold syndrome decoder fault-tolerant",
+    "crispr gene editing": "cas9 guide rna off-target base editing prime editing delivery genome mutation therapy",
+    "solid state batteries": "electrolyte lithium anode dendrites ceramic polymer interface conductivity cathode cycling",
+    "microplastics marine life": "plankton ingestion fish polymer particles ocean sediment toxicity food chain accumulation",
+    "graph neural networks": "message passing node embeddings molecules aggregation attention over-smoothing edges graphs",
+    "central bank policy": "interest rates inflation monetary tightening balance sheet unemployment bonds liquidity",
+    "coffee crop climate": "arabica drought temperature yields brazil rainfall altitude farmers rust harvest",
+}
+INDEX_ASPECTS = ("overview", "recent advances", "limitations", "benchmarks", "applications", "open problems")
+
+
+def bench_index(args):
+    # A repeated-domain workload (--jobs queries over a few research topics)
+    # through the searcher's retrieval-first step, with and without the local
+    # index. The "web" is a fake ranking over a fixed corpus, so every result
+    # has a known topic and aspect, and context relevance can be scored.
+    use_temp_cache_dir()
+    import random
+    import agents
+    from followup import terms
+    from tokens import count_tokens
+    from vector_index import get_source_index
+
+    rng = random.Random(7)
+    corpus = []
+    for topic, vocabulary in INDEX_TOPICS.items():
+        words = vocabulary.split()
+        for aspect in INDEX_ASPECTS:
+            for n in range(5):
+                sentences = [f"{topic} {aspect}: " + " ".join(rng.sample(words, 5)) + "." for _ in range(12)]
+                corpus.append({"url": f"https://example.org/{topic.replace(' ', '-')}/{aspect.replace(' ', '-')}/{n}",
+                               "title": f"{aspect} of {topic}", "content": " ".join(sentences), "topic": (topic, aspect)})
+    vocab = [(doc, set(terms(doc["content"]))) for doc in corpus]
+    web_calls = []
+
+    def web_search(query):
+        # Top 5 documents by word overlap, like a search engine would rank them
+        web_calls.append(query)
+        wanted = set(terms(query))
+        ranked = sorted(vocab, key=lambda item: -len(wanted & item[1]))
+        return {"results": [dict(doc) for doc, _ in ranked[:5]]}
+
+    topics = list(INDEX_TOPICS)
+    workload = []
+    for _ in range(args.jobs):
+        topic = topics[min(int(rng.expovariate(0.5)), len(topics) - 1)]  # a few topics dominate
+        aspect = rng.choice(INDEX_ASPECTS)
+        workload.append(((topic, aspect), f"{aspect} {topic}"))
+    topic_of = {doc["url"]: doc["topic"] for doc in corpus}
+
+    for use_index in (False, True):
+        web_calls.clear()
+        settings = {"local_index": use_index}
+        context_tokens = relevant = returned = 0
+        lookups = []
+        for topic, query in workload:
+            start = time.perf_counter()
+            contents, remaining = agents.split_local([query], settings)
+            lookups.append(time.perf_counter() - start)
+            search = agents.indexed(web_search, settings)
+            for q in remaining:
+                contents.append(agents.format_search_results(q, search(q)))
+            text = "\n\n".join(contents)
+            context_tokens += count_tokens(text)
+            urls = [line[len("Source: "):] for line in text.splitlines() if line.startswith("Source: ")]
+            returned += len(urls)
+            relevant += sum(topic_of.get(url) == topic for url in urls)
+        name = "with index" if use_index else "web only"
+        print(f"{name:<11} {len(web_calls)} web searches for {args.jobs} queries")
+        report_value(f"{name} web searches", len(web_calls), "calls", False)
+        report_value(f"{name} context tokens/query", context_tokens / args.jobs, "tokens", False)
+        report_value(f"{name} relevant results", relevant / max(returned, 1) * 100, "%", True)
+        if use_index:
+            report("index lookup", lookups)
+            print(f"index: {len(get_source_index())} chunks")
+
+
+# Each startup probe runs in a fresh interpreter and prints its timings (s)
+STARTUP_PROBES = {
+    "import graph": "import time; t = time.perf_counter(); import graph; print(time.perf_counter() - t)",
+    "graph ready": "import time; t = time.perf_counter(); import graph; graph.get_graph(); print(time.perf_counter() - t)",
+    "import main.py": "import sys, time; sys.path.insert(0, '..'); t = time.perf_counter(); import main; "
+                      "print(time.perf_counter() - t)",
+}
+# First run and rerun of a Streamlit script, via streamlit's AppTest
+APP_PROBE = """import time, warnings
+warnings.simplefilter("ignore")
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({path!r}, default_timeout=120)
+t = time.perf_counter(); at.run(); first = time.perf_counter() - t
+assert not at.exception, at.exception
+t = time.perf_counter(); at.run(); print(first, time.perf_counter() - t)
+"""
+
+
+def bench_startup(args):
+    # Cold start: module import and first-render times in fresh processes,
+    # plus what every Streamlit rerun (each click) costs afterwards
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "TAVILY_API_KEY", "OPENAI_API_KEY")}
+    env["DEEPRESEARCH_CACHE_DIR"] = tempfile.mkdtemp(prefix="deepresearch-bench-")
+    env["PYTHONWARNINGS"] = "ignore"
+
+    def probe(code):
+        out = subprocess.run([sys.executable, "-c", code], cwd=here, env=env, capture_output=True, text=True)
+        if out.returncode:
+            raise RuntimeError(out.stderr.strip().splitlines()[-1])
+        return [float(v) for v in out.stdout.strip().splitlines()[-1].split()]
+
+    for name, code in STARTUP_PROBES.items():
+        report(name, [probe(code)[0] for _ in range(args.runs)])
+    for name, path in (("research app", os.path.join(here, "app.py")),
+                       ("pdf app", os.path.join(os.path.dirname(here), "app.py"))):
+        runs = [probe(APP_PROBE.format(path=path)) for _ in range(args.runs)]
+        report(f"{name} first run", [first for first, _ in runs])
+        report(f"{name} rerun", [rerun for _, rerun in runs])
+
+
+# --- Chat sidebar and transcript ---
+CHAT_ANSWER = """## Findings on {topic}
+
+Recent work on {topic} reports steady gains on standard benchmarks [1][2].
+
+- **Method**: a two-stage pipeline with retrieval and re-ranking
+- **Data**: public corpora plus a curated evaluation set
+- **Result**: {n}% relative improvement over the strongest baseline
+
+| Model | Score | Params |
+|-------|-------|--------|
+| Baseline | 71.2 | 7B |
+| Proposed | 74.{n} | 7B |
+
+### Sources
+1. https://arxiv.org/abs/2401.{n:05d}
+2. https://example.org/{topic}/{n}
+"""
+
+
+def bench_chats(args):
+    # Rerun latency of the research app for a user with many long chats: the
+    # store is seeded with --chats chats of --messages messages each, then the
+    # app is driven through AppTest (plain rerun, opening another chat, paging
+    # and searching the sidebar)
+    use_temp_cache_dir()
+    from langchain_core.messages import AIMessage, HumanMessage
+    from chat_store import get_chat_store
+    from streamlit.testing.v1 import AppTest
+
+    store = get_chat_store()
+    owner = "bench"
+    start = time.perf_counter()
+    for c in range(args.chats):
+        chat_id = store.create_chat(owner, title=f"Topic {c}: retrieval study")
+        for m in range(args.messages // 2):
+            store.append_message(chat_id, HumanMessage(content=f"What is new in topic {c}, part {m}?",
+                                                       additional_kwargs={"timestamp": "2025-01-01 12:00:00"}))
+            store.append_message(chat_id, AIMessage(content=CHAT_ANSWER.format(topic=f"topic {c}", n=m),
+                                                    additional_kwargs={"timestamp": "2025-01-01 12:00:05"}))
+    print(f"{args.chats} chats x {args.messages} messages seeded in {time.perf_counter() - start:.1f}s")
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    at = AppTest.from_file(path, default_timeout=120)
+    at.query_params["session"] = owner
+    start = time.perf_counter()
+    at.run()
+    report_value("first run", time.perf_counter() - start, "s", False)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    def timed(action):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            action()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    report("rerun", timed(at.run))
+    report("open chat", timed(lambda: next(b for b in at.sidebar.button if b.key and b.key.startswith("sel_")).click().run()))
+    report("next page", timed(lambda: at.sidebar.button(key="chat_page_next").click().run()))
+    searches = iter(range(args.repeat))
+    report("search", timed(lambda: at.sidebar.text_input(key="chat_search").set_value(f"topic {next(searches)}").run()))
+    print(f"elements per rerun: sidebar {len(at.sidebar.button)} buttons, main {len(at.main.chat_message)} messages")
+
+
+# --- Large PDF ---
+def bench_pdf(args):
+    # Hybrid extraction of a born-digital PDF plus the chunked map-reduce
+    # summary the PDF analyzers run, against the stub Gemini model
+    use_temp_cache_dir()
+    from pdf_extract import extract_pdf, join_pages
+    from stubs import FakeGeminiModel
+    from summarize import summarize_document
+    from tokens import count_tokens
+
+    pdf_bytes = make_pdf_fixture(args.pages)
+    print(f"{args.pages}-page PDF ({len(pdf_bytes) / 1024:.0f} KiB), stub llm latency {args.llm_latency}s")
+    start = time.perf_counter()
+    pages = extract_pdf(pdf_bytes)
+    extract_seconds = time.perf_counter() - start
+    text = join_pages(pages)
+    report_value("extraction", extract_seconds, "s", False)
+    report_value("extraction rate", args.pages / extract_seconds, "pages/s", True)
+
+    model = FakeGeminiModel(latency=args.llm_latency)
+    start = time.perf_counter()
+    summarize_document(text, lambda prompt: model.generate_content(prompt).text)
+    print(f"summary of {count_tokens(text)} tokens in {model.calls} LLM calls")
+    report_value("summary", time.perf_counter() - start, "s", False)
+
+
+# --- Rate limits and latency tails ---
+def bench_scheduler(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from scheduler import CallScheduler, ScheduledClient
+    from stubs import StubServer
+    from tavily import TavilyClient
+
+    def run(search):
+        def one(i):
+            start = time.perf_counter()
+            try:
+                search(f"scheduler test topic {i}")
+                return time.perf_counter() - start
+            except Exception:
+                return None
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, range(args.jobs)))
+        return time.perf_counter() - start, [r for r in results if r is not None]
+
+    with StubServer(search_latency=args.search_latency, fail_rate=args.fail_rate,
+                    slow_rate=args.slow_rate, slow_latency=args.slow_latency) as server:
+        client = TavilyClient(api_key="tvly-stub", api_base_url=server.url)
+        scheduler = CallScheduler(limits={"tavily": {"rate": args.rate, "burst": args.concurrency}})
+        scheduled = ScheduledClient(client, "tavily", hedge_after=args.hedge_after, scheduler=scheduler)
+        print(f"{args.jobs} searches, {args.concurrency} concurrent, {args.fail_rate:.0%} 429s, "
+              f"{args.slow_rate:.0%} slow ({args.slow_latency}s), stub latency {args.search_latency}s")
+        for name, search in (("direct", lambda q: client.search(query=q)), ("scheduled", lambda q: scheduled.search(q))):
+            elapsed, latencies = run(search)
+            print(f"{name:<10} success {len(latencies) / args.jobs:6.1%}   wall {elapsed:6.2f} s")
+            if latencies:
+                report(f"{name} latency", latencies)
+        print(f"scheduler: {scheduler.stats()['tavily']}")
+
+
+SCENARIOS = {
+    "chats": bench_chats,
+    "clients": bench_clients,
+    "followup": bench_followup,
+    "history": bench_history,
+    "index": bench_index,
+    "load": bench_load,
+    "ocr": bench_ocr,
+    "pdf": bench_pdf,
+    "research": bench_research,
+    "scheduler": bench_scheduler,
+    "single": bench_single,
+    "sizing": bench_sizing,
+    "startup": bench_startup,
+    "threads": bench_threads,
+}
+
+
+def compare(baseline_path, tolerance):
+    # Returns the metrics that got worse than the baseline by more than tolerance
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nvs {baseline_path} (tolerance {tolerance:.0%})")
+    for name, (value, higher_is_better) in RESULTS.items():
+        if name not in baseline:
+            continue
+        before = baseline[name][0]
+        change = (value - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"{name:<36} {before:10.2f} -> {value:10.2f}  {change:+7.1%}  {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepResearch offline benchmarks")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=24, help="pages in generated PDF fixtures")
+    parser.add_argument("--dpi", type=int, default=150, help="OCR rasterization DPI")
+    parser.add_argument("--requests", type=int, default=10, help="sequential requests for the single scenario")
+    parser.add_argument("--turns", type=int, default=20, help="chat turns for the history scenario")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per startup probe")
+    parser.add_argument("--chats", type=int, default=500, help="chats for the chats scenario")
+    parser.add_argument("--messages", type=int, default=50, help="messages per chat for the chats scenario")
+    parser.add_argument("--threads", type=int, default=2000, help="chat threads for the threads scenario")
+    parser.add_argument("--jobs", type=int, default=200, help="research jobs for load scenarios")
+    parser.add_argument("--backend", choices=["graph", "pipeline"], default="graph",
+                        help="DeepResearch graph (OpenAI) or main.py pipeline (Gemini) for load")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM latency (s)")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="stub search latency (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="share of stub requests answered with 429")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of stub requests in the latency tail")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="latency of tail requests (s)")
+    parser.add_argument("--rate", type=float, default=200.0, help="scheduler requests/s per provider")
+    parser.add_argument("--time-budget", type=float, help="override the research tiers' wall-clock budget (s)")
+    parser.add_argument("--hedge-after", type=float, default=0.5, help="hedge searches slower than this (s)")
+    parser.add_argument("--memory", action="store_true", help="also trace the peak Python heap (slower)")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed regression vs the baseline")
+    args = parser.parse_args()
+    with track_memory(args.memory):
+        SCENARIOS[args.scenario](args)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(RESULTS, f, indent=2)
+    if args.baseline and compare(args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
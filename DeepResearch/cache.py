@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Shared on-disk cache location for search results, LLM responses and PDF text
+CACHE_DIR = os.environ.get(
+    "DEEPRESEARCH_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+
+class DiskCache:
+    """SQLite key/value store with TTL expiry and size-bounded LRU eviction.
+
+    Values are raw bytes; use get_json/set_json for structured data. A single
+    instance is safe to share between threads (and Streamlit sessions).
+    """
+
+    def __init__(self, path, ttl=None, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._delete(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        size = len(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._total += size
+            self._evict()
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key, obj):
+        self.set(key, json.dumps(obj, separators=(",", ":")))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._total = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def _delete(self, key):
+        row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total -= row[0]
+
+    def _evict(self):
+        # Drop least recently used entries until we are back under the size bound
+        if self.max_bytes is None or self._total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total -= size
+            self.stats.evictions += 1
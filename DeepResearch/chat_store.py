@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from cache import cache_path
+
+# Chats untouched for this long are deleted by prune_idle(); the same default
+# as CHECKPOINT_TTL, so a chat and its graph checkpoints expire together
+CHAT_TTL = float(os.environ.get("CHAT_TTL", os.environ.get("CHECKPOINT_TTL", 30 * 24 * 60 * 60)))
+
+
+class ChatStore:
+    """Chats and their messages in SQLite (WAL), so the app only keeps the
+    open chat in memory and everything survives a restart.
+
+    Chats belong to an owner (the browser session id); listing returns
+    metadata only, messages are loaded per chat on demand. A single instance
+    is safe to share between threads (and Streamlit sessions).
+
+    The owner id is not authentication. The app keeps it in the URL
+    (``?session=``), so that URL is a capability: anyone who has it can read
+    and add to every chat of that owner. Treat it like a password.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chats ("
+            " id TEXT PRIMARY KEY, owner TEXT NOT NULL, title TEXT NOT NULL,"
+            " created REAL NOT NULL, updated REAL NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '', summarized INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS chats_owner ON chats(owner, created);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, timestamp TEXT NOT NULL DEFAULT '');"
+            "CREATE INDEX IF NOT EXISTS messages_chat ON messages(chat_id, id);"
+        )
+
+    def create_chat(self, owner, title="New Chat"):
+        chat_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chats (id, owner, title, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, owner, title, now, now),
+            )
+        return chat_id
+
+    def list_chats(self, owner, limit=None, offset=0, search=""):
+        # Newest first: [{"id", "title", "created"}], without messages. With
+        # search, only chats whose title or messages contain the text
+        where, params = _chat_filter(owner, search)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, title, created FROM chats WHERE {where} ORDER BY created DESC LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [{"id": chat_id, "title": title, "created": created} for chat_id, title, created in rows]
+
+    def count_chats(self, owner, search=""):
+        where, params = _chat_filter(owner, search)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM chats WHERE {where}", params).fetchone()[0]
+
+    def get_chat(self, chat_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, owner, title, created, summary, summarized FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "owner", "title", "created", "summary", "summarized"), row))
+
+    def load_messages(self, chat_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [_message(role, content, timestamp, message_id) for message_id, role, content, timestamp in rows]
+
+    def append_message(self, chat_id, message):
+        # Returns the message as stored, with its id set
+        role = "user" if isinstance(message, HumanMessage) else "assistant"
+        timestamp = message.additional_kwargs.get("timestamp", "")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (chat_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                (chat_id, role, message.content, timestamp),
+            )
+            self._conn.execute("UPDATE chats SET updated = ? WHERE id = ?", (time.time(), chat_id))
+        return _message(role, message.content, timestamp, cursor.lastrowid)
+
+    def rename(self, chat_id, title):
+        with self._lock:
+            self._conn.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
+
+    def save_summary(self, chat_id, summary, summarized):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chats SET summary = ?, summarized = ? WHERE id = ?", (summary, summarized, chat_id)
+            )
+
+    def delete_chat(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+    def prune_idle(self, max_age=CHAT_TTL):
+        # Delete chats (and their messages) not updated for max_age seconds
+        with self._lock:
+            return self._conn.execute("DELETE FROM chats WHERE updated < ?", (time.time() - max_age,)).rowcount
+
+
+def _chat_filter(owner, search):
+    # WHERE clause over chats for an owner, optionally matching title or message text
+    if not search:
+        return "owner = ?", (owner,)
+    pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return (
+        "owner = ? AND (title LIKE ? ESCAPE '\\' OR EXISTS ("
+        "SELECT 1 FROM messages WHERE chat_id = chats.id AND content LIKE ? ESCAPE '\\'))",
+        (owner, pattern, pattern),
+    )
+
+
+def _message(role, content, timestamp, message_id):
+    cls = HumanMessage if role == "user" else AIMessage
+    return cls(content=content, id=str(message_id), additional_kwargs={"timestamp": timestamp})
+
+
+_chat_store = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store():
+    global _chat_store
+    with _store_lock:
+        if _chat_store is None:
+            _chat_store = ChatStore(cache_path("chats.sqlite3"))
+            _chat_store.prune_idle()
+        return _chat_store
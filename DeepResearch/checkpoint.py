@@ -0,0 +1,284 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from cache import cache_path
+
+# Checkpoints kept per thread; older ones (and their writes) are pruned on save.
+# Nothing in the app reads old checkpoints, only the latest state of a thread.
+CHECKPOINTS_PER_THREAD = int(os.environ.get("CHECKPOINTS_PER_THREAD", 2))
+# Threads untouched for this long are deleted by prune_idle()
+CHECKPOINT_TTL = float(os.environ.get("CHECKPOINT_TTL", 30 * 24 * 60 * 60))
+# Serialized values at least this large are zlib-compressed
+COMPRESS_MIN_BYTES = 512
+
+
+class CompressedSerializer:
+    """Wraps a langgraph serializer and zlib-compresses large payloads.
+
+    Checkpoints are msgpack (JsonPlusSerializer) and mostly text, which
+    compresses 3-5x.
+    """
+
+    def __init__(self, serde=None, min_bytes=COMPRESS_MIN_BYTES):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= self.min_bytes:
+            return f"zlib:{type_}", zlib.compress(data, 6)
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_.startswith("zlib:"):
+            return self.serde.loads_typed((type_[len("zlib:"):], zlib.decompress(payload)))
+        return self.serde.loads_typed((type_, payload))
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer backed by a single SQLite (WAL) file.
+
+    Each checkpoint is stored whole (channel values included) and compressed,
+    and only the newest ``keep`` checkpoints of a thread are retained, so disk
+    use stays proportional to the number of live threads and nothing is held
+    in the process heap. The async methods run the same quick queries inline,
+    like MemorySaver does. Safe to share between threads.
+    """
+
+    def __init__(self, path, keep=CHECKPOINTS_PER_THREAD, serde=None):
+        super().__init__(serde=serde or CompressedSerializer())
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+            " parent_id TEXT, type TEXT NOT NULL, checkpoint BLOB NOT NULL,"
+            " metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, updated REAL NOT NULL,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));"
+            "CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints(updated);"
+            "CREATE TABLE IF NOT EXISTS writes ("
+            " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+            " task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL,"
+            " type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL DEFAULT '',"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));"
+        )
+
+    # --- reads ---
+    def get_tuple(self, config):
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = ("SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+                 " WHERE thread_id = ? AND checkpoint_ns = ?")
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            writes = self._writes(thread_id, checkpoint_ns, row[0])
+        return self._tuple(thread_id, checkpoint_ns, row, writes)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint,"
+                 " metadata_type, metadata FROM checkpoints WHERE 1 = 1")
+        params = []
+        if config:
+            configurable = config["configurable"]
+            query += " AND thread_id = ?"
+            params.append(configurable["thread_id"])
+            if configurable.get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(configurable["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            query += " AND checkpoint_id < ?"
+            params.append(get_checkpoint_id(before))
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((row[4], row[5]))
+            if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                writes = self._writes(thread_id, checkpoint_ns, row[0])
+            yield self._tuple(thread_id, checkpoint_ns, row, writes, metadata)
+
+    def _writes(self, thread_id, checkpoint_ns, checkpoint_id):
+        return self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def _tuple(self, thread_id, checkpoint_ns, row, writes, metadata=None):
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata_blob = row
+        if metadata is None:
+            metadata = self.serde.loads_typed((metadata_type, metadata_blob))
+
+        def config_for(cid):
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": cid}}
+
+        return CheckpointTuple(
+            config=config_for(checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=metadata,
+            parent_config=config_for(parent_id) if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    # --- writes ---
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+                     type_, data, metadata_type, metadata_blob, time.time()),
+                )
+                self._prune_thread(thread_id, checkpoint_ns)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            rows.append((configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+                         task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, data, task_path))
+        # Special writes (errors, interrupts) replace earlier ones; regular
+        # writes are only stored once per task and index
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _prune_thread(self, thread_id, checkpoint_ns):
+        # Keep the newest `keep` checkpoints of the thread and their writes
+        cutoff = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+            " ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep - 1),
+        ).fetchone()
+        if cutoff is None:
+            return
+        for table in ("checkpoints", "writes"):
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, cutoff[0]),
+            )
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    def prune(self, thread_ids, *, strategy="keep_latest"):
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+            return
+        keep, self.keep = self.keep, 1
+        try:
+            with self._lock:
+                for thread_id in thread_ids:
+                    namespaces = self._conn.execute(
+                        "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+                    ).fetchall()
+                    for (checkpoint_ns,) in namespaces:
+                        self._prune_thread(thread_id, checkpoint_ns)
+        finally:
+            self.keep = keep
+
+    def prune_idle(self, max_age=CHECKPOINT_TTL):
+        # Delete threads whose latest checkpoint is older than max_age seconds
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated) < ?",
+                (time.time() - max_age,),
+            ).fetchall()
+        for (thread_id,) in rows:
+            self.delete_thread(thread_id)
+        return len(rows)
+
+    def thread_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+
+    # --- async (the queries are short, so they run inline like MemorySaver's) ---
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return self.delete_thread(thread_id)
+
+    async def aprune(self, thread_ids, *, strategy="keep_latest"):
+        return self.prune(thread_ids, strategy=strategy)
+
+    def get_next_version(self, current, channel):
+        # Same scheme as MemorySaver: zero-padded counter, so versions sort as strings
+        current = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current + 1:032}.{0:016}"
+
+
+# One per process, shared by the compiled graph (graph.py) and the app's chat
+# deletion, so both see the same threads (a second MemorySaver would not)
+@functools.lru_cache(maxsize=None)
+def get_checkpointer():
+    # CHECKPOINTER=memory keeps the old in-process MemorySaver (lost on restart)
+    if os.environ.get("CHECKPOINTER", "sqlite") == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+
+        return MemorySaver()
+    saver = SQLiteSaver(cache_path("checkpoints.sqlite3"))
+    saver.prune_idle()
+    return saver
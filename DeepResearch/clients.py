@@ -0,0 +1,59 @@
+import hashlib
+import os
+import threading
+import time
+
+# Idle clients are dropped after this many seconds without use
+CLIENT_IDLE_TTL = float(os.environ.get("CLIENT_IDLE_TTL", 15 * 60))
+
+
+def key_fingerprint(api_key):
+    # Registry keys (and anything that logs them) never hold the raw secret
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+
+
+class ClientPool:
+    """Process-wide registry of reusable API clients.
+
+    ChatOpenAI and TavilySearch keep their HTTP connection pools on the
+    instance, so reusing an instance across node calls (and Streamlit
+    sessions) keeps connections warm. Both are safe to share between threads.
+    """
+
+    def __init__(self, idle_ttl=CLIENT_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self.created = 0
+        self.reused = 0
+        self._clients = {}  # key -> [client, last_used]
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = [factory(), now]
+                self._clients[key] = entry
+                self.created += 1
+            else:
+                entry[1] = now
+                self.reused += 1
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def _evict_idle(self, now):
+        if self.idle_ttl is None:
+            return
+        stale = [key for key, (_, last_used) in self._clients.items() if now - last_used > self.idle_ttl]
+        for key in stale:
+            del self._clients[key]
+
+
+client_pool = ClientPool()
@@ -0,0 +1,73 @@
+import re
+from urllib.parse import urldefrag
+
+from tokens import truncate_tokens
+
+DEFAULT_SNIPPET_TOKENS = 200
+# Snippets sharing at least this fraction of word trigrams count as duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+def iter_results(search_results):
+    # Accepts a Tavily response dict, a list of responses, or a list of results
+    if isinstance(search_results, dict):
+        yield from search_results.get("results", [])
+    elif isinstance(search_results, list):
+        for item in search_results:
+            if isinstance(item, dict) and "results" in item:
+                yield from item["results"]
+            elif isinstance(item, dict):
+                yield item
+
+
+def _normalize_url(url):
+    return urldefrag(url.strip())[0].rstrip("/").lower()
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def compact_results(search_results, snippet_tokens=DEFAULT_SNIPPET_TOKENS, max_sources=None):
+    # Only title/url/content survive, deduplicated by URL and near-duplicate
+    # content, each snippet trimmed to snippet_tokens
+    kept, seen_urls, seen_shingles = [], set(), []
+    for result in iter_results(search_results):
+        url = result.get("url", "")
+        content = " ".join((result.get("content") or "").split())
+        if not content:
+            continue
+        key = _normalize_url(url)
+        if key and key in seen_urls:
+            continue
+        shingles = _shingles(content)
+        if any(_similarity(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in seen_shingles):
+            continue
+        seen_urls.add(key)
+        seen_shingles.append(shingles)
+        kept.append({
+            "title": (result.get("title") or "").strip(),
+            "url": url,
+            "content": truncate_tokens(content, snippet_tokens),
+        })
+        if max_sources and len(kept) >= max_sources:
+            break
+    return kept
+
+
+def format_sources(sources):
+    # Citation-numbered block: "[1] Title\nurl\nsnippet"
+    return "\n\n".join(
+        f"[{i}] {source['title']}\n{source['url']}\n{source['content']}" for i, source in enumerate(sources, start=1)
+    )
+
+
+def compact_search_results(search_results, snippet_tokens=DEFAULT_SNIPPET_TOKENS, max_sources=None):
+    return format_sources(compact_results(search_results, snippet_tokens, max_sources))
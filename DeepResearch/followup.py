@@ -0,0 +1,124 @@
+import math
+import os
+import re
+from collections import Counter
+
+# Local follow-up vs fresh-topic classifier for the writer. It compares the
+# query with the previous turn (bag-of-words cosine and weighted term overlap)
+# and looks for conversational cues; only queries it cannot call either way
+# go to the LLM. Set FOLLOWUP_HEURISTICS=0 to always ask the LLM.
+FOLLOWUP_HEURISTICS = os.environ.get("FOLLOWUP_HEURISTICS", "1") != "0"
+
+FOLLOWUP = "follow-up"
+FRESH = "fresh"
+
+# Weighted share of the query's terms found in the previous turn (see
+# topic_weights); scores in between go to the LLM
+FOLLOWUP_OVERLAP = 1 / 3
+FRESH_OVERLAP = 0.1
+# Least weight of a term from the previous query
+QUERY_TERM_WEIGHT = 0.5
+# Queries this short say too little to call them fresh on overlap alone
+SHORT_QUERY_TERMS = 2
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be been being below between both but by can could
+did do does doing down during each few for from further had has have having he her here hers him his how i if
+in into is it its itself just me more most my no nor not now of off on once only or other our out over own same
+she should so some such than that the their them then there these they this those through to too under until
+up very was we were what when where which while who whom why will with would you your please tell give show
+explain describe discuss detail details research paper papers study studies
+""".split())
+
+# Words that point back at the previous answer
+ANAPHORA = frozenset("it its this that these those they them their above previous earlier same".split())
+FOLLOWUP_CUES = (
+    "elaborate", "expand on", "more detail", "more about", "go deeper", "dig deeper", "explain further",
+    "tell me more", "what about", "how about", "and what", "clarify", "in other words", "for example",
+    "an example", "why is that", "how so", "summarize", "methodology", "limitations", "step by step",
+)
+# Phrases that can only refer to the previous answer
+BACK_REFERENCES = (
+    "you mentioned", "your answer", "you said", "the paper", "the study", "the authors", "the article",
+    "the first one", "the second one", "the last one", "mentioned above", "as above",
+)
+FRESH_CUES = (
+    "new topic", "different topic", "another topic", "unrelated", "change the subject", "switch to",
+    "switching to", "something else", "different question", "new question", "moving on",
+)
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9+]*")
+
+
+def stem(word):
+    # Just enough to match plurals ("batteries"/"battery", "heads"/"head")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text):
+    return [stem(w) for w in _WORD.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm
+
+
+def topic_weights(previous_query, previous_response):
+    # term -> weight in [0, 1] of how central it was to the previous turn. An
+    # answer term weighs its count relative to the answer's most repeated
+    # term: a long answer mentions plenty of common words once, and those
+    # must not make an unrelated query look like a follow-up. Terms of the
+    # previous query name the topic, but can be generic ("state" in "solid
+    # state"), so they get QUERY_TERM_WEIGHT, or their answer weight if higher
+    counts = Counter(terms(previous_response))
+    top = max(counts.values(), default=1)
+    weights = {term: count / top for term, count in counts.items()}
+    for term in terms(previous_query):
+        weights[term] = max(QUERY_TERM_WEIGHT, weights.get(term, 0.0))
+    return weights
+
+
+def classify(query, previous_query="", previous_response=""):
+    # FOLLOWUP, FRESH, or None when the LLM should decide
+    text = " " + re.sub(r"\s+", " ", query.lower()) + " "
+    if any(cue in text for cue in FRESH_CUES):
+        return FRESH
+    if any(phrase in text for phrase in BACK_REFERENCES):
+        return FOLLOWUP
+    words = _WORD.findall(text)
+    query_terms = Counter(terms(query))
+    weights = topic_weights(previous_query, previous_response)
+    overlap = sum(weights.get(term, 0.0) for term in query_terms) / len(query_terms) if query_terms else 0.0
+    similarity = cosine(query_terms, Counter(terms(previous_query)))
+
+    cue = any(cue in text for cue in FOLLOWUP_CUES)
+    points_back = any(w in ANAPHORA for w in words)
+    if overlap >= FOLLOWUP_OVERLAP or similarity >= FOLLOWUP_OVERLAP:
+        return FOLLOWUP
+    if (cue or points_back) and (overlap >= FRESH_OVERLAP or len(query_terms) <= SHORT_QUERY_TERMS):
+        return FOLLOWUP
+    if not cue and not points_back and overlap <= FRESH_OVERLAP and len(query_terms) > SHORT_QUERY_TERMS:
+        return FRESH
+    return None
+
+
+def previous_turn(chat_history, summary=""):
+    # (previous user query, previous answer) from the recent history; the
+    # rolling summary stands in for the answer when the turns were folded away
+    previous_query = previous_response = ""
+    for message in reversed(chat_history):
+        if not previous_response and message.type == "ai":
+            previous_response = str(message.content)
+        elif not previous_query and message.type == "human":
+            previous_query = str(message.content)
+        if previous_query and previous_response:
+            break
+    return previous_query, previous_response or summary
@@ -1,36 +1,114 @@
-from typing import TypedDict, Annotated, List, Dict, Any
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from typing import TypedDict, Annotated, List
+from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import BaseMessage
-import operator
+from langchain_core.runnables import RunnableLambda
+import functools
 
 # Import nodes from agents.py
-from agents import planner_node, searcher_node, writer_node
+from agents import (
+    planner_node, aplanner_node, prefetch_node, aprefetch_node,
+    searcher_node, asearcher_node, assess_node, aassess_node, route_research,
+    writer_node, awriter_node, WRITER_STREAM_TAG,
+)
+from telemetry import Trace, traced, tracing
+from checkpoint import get_checkpointer
+
+def merge_content(left, right):
+    # Search branches append their results (and queries); None clears the
+    # list (the writer does this once it has used it), so results do not pile
+    # up across the turns of a checkpointed thread
+    if right is None:
+        return []
+    return left + right
 
 # Define the state with reducers
 class AgentState(TypedDict):
     query: str
     plan: str
-    content: Annotated[List[str], operator.add]
+    content: Annotated[List[str], merge_content]
     response: str
+    # Recent turns only; older ones arrive folded into history_summary (see history.py)
     chat_history: List[BaseMessage]
+    history_summary: str
+    # Research loop (see assess_node): the plan steps to cover, search rounds
+    # run so far, steps still uncovered, content entries already assessed,
+    # queries searched this turn (cleared by the writer), when planning
+    # started, and why the loop stopped
+    steps: List[str]
+    current_step: int
+    gaps: List[str]
+    assessed: int
+    searched: Annotated[List[str], merge_content]
+    started: float
+    research_stop: str
 
 # Initialize Graph
 workflow = StateGraph(AgentState)
 
-# Add Nodes
-workflow.add_node("planner", planner_node)
-workflow.add_node("searcher", searcher_node)
-workflow.add_node("writer", writer_node)
+# Add Nodes (sync implementations serve graph.invoke/stream, async ones graph.ainvoke/astream)
+def add_node(name, func, afunc):
+    # Every node runs in a telemetry span (see telemetry.py)
+    workflow.add_node(name, RunnableLambda(traced(name, func), afunc=traced(name, afunc), name=name))
+
+add_node("planner", planner_node, aplanner_node)
+add_node("prefetch", prefetch_node, aprefetch_node)
+add_node("searcher", searcher_node, asearcher_node)
+add_node("assess", assess_node, aassess_node)
+add_node("writer", writer_node, awriter_node)
 
-# Set Entry Point
-workflow.set_entry_point("planner")
+# Entry: planning and a search on the raw query start in parallel
+workflow.add_edge(START, "planner")
+workflow.add_edge(START, "prefetch")
 
-# Add Edges
-workflow.add_edge("planner", "searcher")
-workflow.add_edge("searcher", "writer")
+# Add Edges: the searcher starts once the plan and the raw-query results are
+# in, then search rounds repeat until assess sends the results to the writer
+workflow.add_edge(["planner", "prefetch"], "searcher")
+workflow.add_edge("searcher", "assess")
+workflow.add_conditional_edges("assess", route_research, ["searcher", "writer"])
 workflow.add_edge("writer", END)
 
-# Compile the graph with memory
-memory = MemorySaver()
-graph = workflow.compile(checkpointer=memory)
+# Compile the graph with a disk-backed checkpointer (see checkpoint.py), so
+# thread state survives restarts and does not accumulate in the process.
+# Compiled on first use and then shared by the whole process; `graph` and
+# `memory` still work as module attributes.
+@functools.lru_cache(maxsize=None)
+def get_graph():
+    return workflow.compile(checkpointer=get_checkpointer())
+
+def __getattr__(name):
+    if name == "graph":
+        return get_graph()
+    if name == "memory":
+        return get_graph().checkpointer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Stream a research run: yields ("stage", node, seconds, update) as each node
+# finishes and ("token", text) for every token of the final writer answer.
+# seconds is the node's own run time from its span (see traced), so nodes
+# running in parallel and repeated search rounds each report their own time;
+# the spans go to `trace` if one is passed.
+def stream_research(inputs, config, trace=None):
+    trace = trace or Trace()
+    reported = set()
+    events = iter(get_graph().stream(inputs, config=config, stream_mode=["updates", "messages"]))
+    while True:
+        # Only advance the stream inside the trace, so the nodes it starts
+        # record their spans there and the caller's context is left alone
+        with tracing(trace=trace):
+            event = next(events, None)
+        if event is None:
+            return
+        mode, payload = event
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") == "writer" and WRITER_STREAM_TAG in metadata.get("tags", []):
+                if chunk.content:
+                    yield ("token", chunk.content)
+        elif mode == "updates":
+            for node, update in payload.items():
+                # A node's span has finished by the time its update arrives
+                index = next((i for i, s in enumerate(trace.spans)
+                              if s.name == node and s.parent is None and i not in reported), None)
+                reported.add(index)
+                seconds = trace.spans[index].seconds if index is not None else 0.0
+                yield ("stage", node, seconds, update or {})
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Turns (user message + answer) kept verbatim; older ones are summarized
+RECENT_TURNS = int(os.environ.get("HISTORY_RECENT_TURNS", 3))
+# History token budget per node, summary included
+NODE_HISTORY_TOKENS = {
+    "planner": int(os.environ.get("PLANNER_HISTORY_TOKENS", 1000)),
+    "writer": int(os.environ.get("WRITER_HISTORY_TOKENS", 2500)),
+}
+SUMMARY_MAX_TOKENS = 400
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You maintain a running summary of a research conversation.
+Fold the new messages into the summary. Keep the topics researched, key findings and
+any preferences or constraints the user stated. Stay under {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+# One worker: summaries are cheap and must not compete with live requests
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+
+def split_history(messages, recent_turns=RECENT_TURNS):
+    # (older, recent) where recent holds the last `recent_turns` turns
+    cut = max(0, len(messages) - 2 * recent_turns)
+    return messages[:cut], messages[cut:]
+
+
+def message_tokens(message):
+    return count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_message(summary):
+    return SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+
+
+def fit_history(messages, max_tokens, summary=""):
+    # Newest messages first until the budget is spent; the summary of older
+    # turns goes in front. The latest message is kept (truncated) even if it
+    # alone is over budget.
+    fitted = []
+    used = 0
+    if summary:
+        summary = truncate_tokens(summary, SUMMARY_MAX_TOKENS)
+        used = message_tokens(summary_message(summary))
+    for message in reversed(messages):
+        tokens = message_tokens(message)
+        if used + tokens > max_tokens:
+            if not fitted:
+                room = max(max_tokens - used - MESSAGE_OVERHEAD_TOKENS, 1)
+                fitted.append(message.model_copy(update={"content": truncate_tokens(str(message.content), room)}))
+            break
+        fitted.append(message)
+        used += tokens
+    fitted.reverse()
+    return ([summary_message(summary)] if summary else []) + fitted
+
+
+def history_tokens(messages):
+    return sum(message_tokens(m) for m in messages)
+
+
+def node_history(state, node):
+    # The chat history a node puts in its prompt, within the node's budget
+    return fit_history(state.get("chat_history", []), NODE_HISTORY_TOKENS[node], state.get("history_summary", ""))
+
+
+def format_messages(messages):
+    lines = []
+    for message in messages:
+        role = "User" if isinstance(message, HumanMessage) else "Assistant" if isinstance(message, AIMessage) else "System"
+        lines.append(f"{role}: {message.content}")
+    return "\n\n".join(lines)
+
+
+class RollingSummary:
+    """Incrementally updated summary of the turns older than the recent window.
+
+    ``refresh`` folds newly aged-out turns into the summary on a background
+    thread after a response has been shown; ``context`` never waits for it.
+    Until a refresh lands, the not-yet-summarized turns are simply passed on
+    verbatim (and trimmed by the node budgets), so nothing is lost.
+    """
+
+    def __init__(self, recent_turns=RECENT_TURNS, summary="", summarized=0):
+        # summary/summarized restore a persisted summary (see chat_store.py)
+        self.recent_turns = recent_turns
+        self.summary = summary
+        self.summarized = summarized  # messages covered by the summary
+        self._future = None
+        self._lock = threading.Lock()
+
+    def context(self, messages):
+        # (summary, messages it does not cover yet)
+        self._collect()
+        return self.summary, messages[self.summarized:]
+
+    def refresh(self, messages, complete):
+        # complete(prompt) -> text, called on the background thread
+        self._collect()
+        older, _ = split_history(messages, self.recent_turns)
+        with self._lock:
+            if self._future is not None or len(older) <= self.summarized:
+                return
+            new_messages = older[self.summarized:]
+            self._future = _executor.submit(self._fold, complete, self.summary, new_messages, len(older))
+
+    def wait(self, timeout=None):
+        # Block until a pending refresh has landed (benchmarks, shutdown)
+        future = self._future
+        if future is not None:
+            future.exception(timeout)
+        self._collect()
+
+    def _fold(self, complete, summary, new_messages, covered):
+        prompt = SUMMARY_PROMPT.format(
+            max_words=int(SUMMARY_MAX_TOKENS * 0.75),
+            summary=summary or "(empty)",
+            messages=format_messages(new_messages),
+        )
+        return truncate_tokens(complete(prompt).strip(), SUMMARY_MAX_TOKENS), covered
+
+    def _collect(self):
+        with self._lock:
+            if self._future is None or not self._future.done():
+                return
+            future, self._future = self._future, None
+        try:
+            summary, covered = future.result()
+        except Exception as e:
+            # Keep the old summary; the same turns are retried on the next refresh
+            logger.warning("history summary failed: %s", e)
+            return
+        with self._lock:
+            self.summary, self.summarized = summary, covered
@@ -0,0 +1,184 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from cache import DiskCache, cache_path
+from telemetry import CACHE_HIT, record
+
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 512))
+# Set LLM_CACHE_PERSIST=1 to also keep responses on disk across restarts
+LLM_CACHE_PERSIST = os.environ.get("LLM_CACHE_PERSIST", "0") == "1"
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+
+
+class CacheMiss(Exception):
+    """Raised by ResponseCache.lookup on a miss inside cache_only()."""
+
+
+_cache_only = contextvars.ContextVar("llm_cache_only", default=False)
+
+
+@contextmanager
+def cache_only():
+    # Answer LLM calls in this block from the cache or raise CacheMiss, so
+    # callers can skip the rate limiter for responses that need no request
+    token = _cache_only.set(True)
+    try:
+        yield
+    finally:
+        _cache_only.reset(token)
+
+
+class LLMCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.latency_saved = 0.0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "latency_saved_s": round(self.latency_saved, 3),
+        }
+
+
+def _collapse(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _message_parts(node, parts):
+    # Walk the serialized messages and keep only what the model actually sees
+    if isinstance(node, list):
+        for item in node:
+            _message_parts(item, parts)
+    elif isinstance(node, dict):
+        kwargs = node.get("kwargs")
+        if isinstance(kwargs, dict) and "content" in kwargs:
+            role = kwargs.get("type") or node.get("id", ["?"])[-1]
+            content = kwargs["content"]
+            if not isinstance(content, str):
+                content = json.dumps(content, sort_keys=True)
+            parts.append(f"{role}:{_collapse(content)}")
+        else:
+            for value in node.values():
+                _message_parts(value, parts)
+
+
+def normalize_prompt(prompt):
+    # Chat prompts arrive as serialized message lists. Per-message metadata
+    # such as the UI timestamps in additional_kwargs never reaches the model,
+    # so two prompts that differ only there (or in whitespace) share a key.
+    try:
+        parsed = json.loads(prompt)
+    except (TypeError, ValueError):
+        return _collapse(prompt)
+    parts = []
+    _message_parts(parsed, parts)
+    return "\n".join(parts) if parts else _collapse(prompt)
+
+
+def response_key(prompt, llm_string):
+    raw = normalize_prompt(prompt) + "\0" + llm_string
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(BaseCache):
+    """In-memory LRU of LLM generations with an optional DiskCache behind it.
+
+    Keys cover the model parameters (``llm_string``) and the normalized prompt.
+    Only deterministic (temperature 0) models should be given this cache.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, disk=None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.stats = LLMCacheStats()
+        self._memory = OrderedDict()  # key -> (generations, size, latency)
+        # key -> time of the miss, to measure the real call. A failed call never
+        # reaches update(), so this is bounded like _memory, oldest misses first
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt, llm_string):
+        key = response_key(prompt, llm_string)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None and self.disk is not None:
+            stored = self.disk.get_json(key)
+            if stored is not None:
+                entry = (loads(stored["value"]), stored["size"], stored["latency"])
+                self._remember(key, entry)
+        if entry is None and _cache_only.get():
+            raise CacheMiss(key)
+        with self._lock:
+            if entry is None:
+                self.stats.misses += 1
+                self._pending[key] = time.perf_counter()
+                self._pending.move_to_end(key)
+                while len(self._pending) > self.max_entries:
+                    self._pending.popitem(last=False)
+                return None
+            generations, size, latency = entry
+            record(llm_cache_hits=1)
+            self.stats.hits += 1
+            self.stats.bytes_saved += size
+            self.stats.latency_saved += latency
+        # Tagged copies, so token accounting can tell hits from real calls
+        return [g.model_copy(update={"generation_info": {**(g.generation_info or {}), CACHE_HIT: True}})
+                for g in generations]
+
+    def update(self, prompt, llm_string, return_val):
+        key = response_key(prompt, llm_string)
+        with self._lock:
+            started = self._pending.pop(key, None)
+        latency = time.perf_counter() - started if started is not None else 0.0
+        serialized = dumps(return_val)
+        entry = (return_val, len(serialized.encode("utf-8")), latency)
+        self._remember(key, entry)
+        if self.disk is not None:
+            self.disk.set_json(key, {"value": serialized, "size": entry[1], "latency": latency})
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+            self._pending.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            disk = None
+            if LLM_CACHE_PERSIST:
+                disk = DiskCache(cache_path("llm.sqlite3"), ttl=LLM_CACHE_TTL)
+            _cache = ResponseCache(disk=disk)
+        return _cache
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+
+from cache import DiskCache, cache_path
+from pdf_extract import DEFAULT_OCR_DPI, TESSERACT_CMD, PageResult, count_pages, extract_pdf
+
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            # Keyed by content hash, so entries never go stale; size bound only
+            _cache = DiskCache(cache_path("pdf.sqlite3"), ttl=None, max_bytes=PDF_CACHE_MAX_BYTES)
+        return _cache
+
+
+def pdf_digest(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _key(kind, digest, **settings):
+    return kind + ":" + digest + ":" + json.dumps(settings, sort_keys=True, default=str)
+
+
+def cached_extract_pdf(pdf_bytes, pages=None, dpi=DEFAULT_OCR_DPI, workers=None,
+                       tesseract_cmd=TESSERACT_CMD, force_ocr=False, progress=None):
+    # Same result as extract_pdf, but each page is cached by PDF hash and
+    # extraction settings, so reruns, re-uploads and new page ranges only
+    # extract pages that were never seen before
+    cache = get_pdf_cache()
+    digest = pdf_digest(pdf_bytes)
+    if pages is None:
+        pages = range(count_pages(pdf_bytes))
+    pages = list(pages)
+
+    results = {}
+    for page_number in pages:
+        stored = cache.get_json(_key("page", digest, page=page_number, dpi=dpi, force_ocr=force_ocr))
+        if stored is not None:
+            results[page_number] = PageResult(page_number, stored["text"], stored["method"], stored["seconds"])
+
+    def report(extracted, _total):
+        if progress:
+            progress(len(results) + extracted, len(pages))
+
+    missing = [n for n in pages if n not in results]
+    if missing:
+        for result in extract_pdf(pdf_bytes, missing, dpi, workers, tesseract_cmd, force_ocr, report):
+            results[result.page_number] = result
+            # Pages we could not read (no text layer, no OCR) may succeed later
+            if result.method != "none":
+                cache.set_json(
+                    _key("page", digest, page=result.page_number, dpi=dpi, force_ocr=force_ocr),
+                    {"text": result.text, "method": result.method, "seconds": result.seconds},
+                )
+    else:
+        report(0, len(pages))
+    return [results[n] for n in pages]
+
+
+def cached_summary(digest, summarize, **settings):
+    # settings should name everything the summary depends on (model, pages, dpi, ...)
+    cache = get_pdf_cache()
+    key = _key("summary", digest, **settings)
+    summary = cache.get(key)
+    if summary is not None:
+        return summary.decode("utf-8")
+    summary = summarize()
+    cache.set(key, summary)
+    return summary
+
+
+def pdf_cache_stats():
+    cache = get_pdf_cache()
+    return {**cache.stats.as_dict(), "entries": len(cache), "size_mb": round(cache.total_bytes / 1024 / 1024, 2)}
@@ -0,0 +1,318 @@
+import importlib.util
+import io
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import NamedTuple
+
+# PyMuPDF renders at 72 dpi unless told otherwise; higher DPI reads small print
+# better at the cost of OCR time
+DEFAULT_OCR_DPI = 72
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD")
+# Pages with less embedded text than this are treated as scans and OCRed
+MIN_TEXT_CHARS = 25
+# OCR engine: "tesserocr" keeps loaded Tesseract API handles for reuse and
+# feeds them the raw pixmap; "pytesseract" runs the tesseract CLI for every page.
+# "auto" uses tesserocr when it is installed.
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+
+
+class PageResult(NamedTuple):
+    page_number: int  # 0-based
+    text: str
+    method: str  # "text" (embedded text layer), "ocr", or "none" (no text, OCR unavailable)
+    seconds: float
+
+
+def parse_page_range(spec, page_count):
+    # "1-3, 7" -> [0, 1, 2, 6]; empty means every page
+    if not spec or not spec.strip():
+        return list(range(page_count))
+    pages = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            first, last = int(start), int(end) if end.strip() else page_count
+        else:
+            first = last = int(part)
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Page range '{part}' is outside 1-{page_count}")
+        pages.extend(n - 1 for n in range(first, last + 1) if n - 1 not in pages)
+    return pages
+
+
+def _has_fitz():
+    return importlib.util.find_spec("fitz") is not None
+
+
+def count_pages(pdf_bytes):
+    if not _has_fitz():
+        import pypdf
+
+        return len(pypdf.PdfReader(io.BytesIO(pdf_bytes)).pages)
+    import fitz
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        return pdf.page_count
+
+
+def ocr_backend(tesseract_cmd=TESSERACT_CMD, backend=None):
+    # The engine to OCR with, or None when OCR is unavailable
+    backend = backend or OCR_BACKEND
+    if not _has_fitz():
+        return None
+    if backend in ("auto", "tesserocr") and importlib.util.find_spec("tesserocr") is not None:
+        return "tesserocr"
+    if backend == "tesserocr" or importlib.util.find_spec("pytesseract") is None:
+        return None
+    if tesseract_cmd:
+        return "pytesseract" if os.path.exists(tesseract_cmd) else None
+    return "pytesseract" if shutil.which("tesseract") is not None else None
+
+
+def ocr_available(tesseract_cmd=TESSERACT_CMD):
+    return ocr_backend(tesseract_cmd) is not None
+
+
+def _iter_native_text(pdf_bytes, pages):
+    # Yields (page_number, text, seconds) from the embedded text layer
+    if _has_fitz():
+        import fitz
+
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+            for page_number in pages:
+                start = time.perf_counter()
+                text = pdf[page_number].get_text()
+                yield page_number, text, time.perf_counter() - start
+    else:
+        import pypdf
+
+        reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+        for page_number in pages:
+            start = time.perf_counter()
+            text = reader.pages[page_number].extract_text() or ""
+            yield page_number, text, time.perf_counter() - start
+
+
+# --- OCR engines ---
+# Both the worker pool and the tesserocr handles outlive a single document:
+# starting a worker and loading the Tesseract model are paid once per
+# process, not per upload. A pool task OCRs a contiguous run of pages, so
+# the document is sent to a worker (and opened there) once per run.
+_worker_api = None
+# Idle tesserocr handles of this process by tesseract_cmd; a handle is used
+# by one thread at a time
+_tess_idle = {}
+_tess_lock = threading.Lock()
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def _tessdata_path(tesseract_cmd):
+    # A Windows install keeps tessdata next to tesseract.exe; otherwise the
+    # library's own default (or TESSDATA_PREFIX) applies
+    if tesseract_cmd:
+        path = os.path.join(os.path.dirname(tesseract_cmd), "tessdata")
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def _new_tess(tesseract_cmd):
+    import tesserocr
+
+    path = _tessdata_path(tesseract_cmd)
+    return tesserocr.PyTessBaseAPI(path=path, lang=OCR_LANG) if path else tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+
+
+def _checkout_tess(tesseract_cmd):
+    with _tess_lock:
+        idle = _tess_idle.get(tesseract_cmd)
+        if idle:
+            return idle.pop()
+    return _new_tess(tesseract_cmd)
+
+
+def _checkin_tess(tesseract_cmd, api):
+    with _tess_lock:
+        _tess_idle.setdefault(tesseract_cmd, []).append(api)
+
+
+def _prepare_engine(tesseract_cmd, backend, new_tess=_checkout_tess):
+    # The tesserocr handle to OCR with, or None for pytesseract
+    if ocr_backend(tesseract_cmd, backend) == "tesserocr":
+        return new_tess(tesseract_cmd)
+    import pytesseract
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return None
+
+
+def _init_ocr_worker(tesseract_cmd, backend=None):
+    # Worker processes keep their handle for as long as the pool lives. A
+    # fresh one: a forked worker must not share the parent's idle handles
+    global _worker_api
+    _worker_api = _prepare_engine(tesseract_cmd, backend, _new_tess)
+
+
+def _ocr_pdf_page(pdf, api, page_number, dpi):
+    import fitz
+
+    start = time.perf_counter()
+    # Rasterize straight to 8-bit grayscale: a third of the RGB buffer, and
+    # what Tesseract binarizes from anyway
+    pix = pdf[page_number].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    if api is not None:
+        # tesserocr only accepts bytes, so samples is the one copy of the page
+        api.SetImageBytes(pix.samples, pix.width, pix.height, 1, pix.stride)
+        text = api.GetUTF8Text()
+    else:
+        import pytesseract
+        from PIL import Image
+
+        # Shares the pixmap buffer; released before the pixmap is
+        img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+        text = pytesseract.image_to_string(img, lang=OCR_LANG)
+        del img
+    return page_number, text, time.perf_counter() - start
+
+
+def _ocr_pages(pdf_bytes, pages, dpi):
+    # Pool task: one run of pages of one document
+    import fitz
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        return [_ocr_pdf_page(pdf, _worker_api, page_number, dpi) for page_number in pages]
+
+
+def _ocr_pool(workers, tesseract_cmd, backend):
+    # The shared worker pool, replaced only when the engine settings change
+    global _pool, _pool_key
+    key = (workers, tesseract_cmd, backend)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                # Runs already submitted still finish
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker,
+                                        initargs=(tesseract_cmd, backend))
+            _pool_key = key
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def iter_ocr_pages(pdf_bytes, dpi=DEFAULT_OCR_DPI, pages=None, workers=None, tesseract_cmd=TESSERACT_CMD,
+                   backend=None):
+    # Yields (page_number, text, seconds) in page order while later pages are still being OCRed
+    if pages is None:
+        pages = range(count_pages(pdf_bytes))
+    pages = list(pages)
+    workers = min(workers or os.cpu_count() or 1, len(pages))
+    if workers <= 1:
+        # In this process (e.g. the Streamlit server, where several sessions
+        # may OCR at once), so the document and handle stay local to this call
+        import fitz
+
+        api = _prepare_engine(tesseract_cmd, backend)
+        try:
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+                for page_number in pages:
+                    yield _ocr_pdf_page(pdf, api, page_number, dpi)
+        finally:
+            if api is not None:
+                _checkin_tess(tesseract_cmd, api)
+        return
+    # Two runs per worker balance uneven pages without sending the document
+    # more than 2 * workers times
+    size = -(-len(pages) // (workers * 2))
+    runs = [pages[i:i + size] for i in range(0, len(pages), size)]
+    pool = _ocr_pool(workers, tesseract_cmd, backend)
+    try:
+        for results in pool.map(_ocr_pages, repeat(pdf_bytes), runs, repeat(dpi)):
+            yield from results
+    except BrokenProcessPool:
+        # A crashed worker breaks the pool for good; the next call starts a new one
+        _discard_pool(pool)
+        raise
+
+
+def iter_pdf_pages(pdf_bytes, pages=None, dpi=DEFAULT_OCR_DPI, workers=None,
+                   tesseract_cmd=TESSERACT_CMD, force_ocr=False):
+    # Yields a PageResult per page in order. Pages with a usable text layer are
+    # read directly; only image-only pages (or all, with force_ocr) are OCRed.
+    if pages is None:
+        pages = range(count_pages(pdf_bytes))
+    pages = list(pages)
+    can_ocr = ocr_available(tesseract_cmd)
+    native = {}
+    if not (force_ocr and can_ocr):
+        native = {n: (text, seconds) for n, text, seconds in _iter_native_text(pdf_bytes, pages)}
+    needs_ocr = [n for n in pages if n not in native or len(native[n][0].strip()) < MIN_TEXT_CHARS]
+    ocr_results = iter_ocr_pages(pdf_bytes, dpi, needs_ocr, workers, tesseract_cmd) if can_ocr and needs_ocr else iter(())
+    needs_ocr = set(needs_ocr)
+    for page_number in pages:
+        if page_number not in needs_ocr:
+            text, seconds = native[page_number]
+            yield PageResult(page_number, text, "text", seconds)
+        elif can_ocr:
+            _, text, seconds = next(ocr_results)
+            yield PageResult(page_number, text, "ocr", seconds)
+        else:
+            text, seconds = native.get(page_number, ("", 0.0))
+            yield PageResult(page_number, text, "none", seconds)
+
+
+def join_pages(results):
+    parts = []
+    for result in results:
+        parts.append(f"\n\n--- PAGE {result.page_number + 1} ---\n")
+        parts.append(result.text)
+    return "".join(parts)
+
+
+def extract_pdf(pdf_bytes, pages=None, dpi=DEFAULT_OCR_DPI, workers=None,
+                tesseract_cmd=TESSERACT_CMD, force_ocr=False, progress=None):
+    # All PageResults for the selected pages; progress(done, total) is called as pages complete
+    if pages is None:
+        pages = range(count_pages(pdf_bytes))
+    pages = list(pages)
+    results = []
+    for result in iter_pdf_pages(pdf_bytes, pages, dpi, workers, tesseract_cmd, force_ocr):
+        results.append(result)
+        if progress:
+            progress(len(results), len(pages))
+    return results
+
+
+def extraction_summary(results):
+    # e.g. "12 pages: 10 text layer, 2 OCR in 3.4s"
+    counts = {"text": 0, "ocr": 0, "none": 0}
+    for result in results:
+        counts[result.method] += 1
+    total = sum(result.seconds for result in results)
+    summary = f"{len(results)} pages: {counts['text']} text layer, {counts['ocr']} OCR"
+    if counts["none"]:
+        summary += f", {counts['none']} without text (OCR unavailable)"
+    return summary + f" in {total:.1f}s"
+
+
+def extract_text_from_pdf(pdf_bytes, dpi=DEFAULT_OCR_DPI, pages=None, workers=None,
+                          tesseract_cmd=TESSERACT_CMD, progress=None, force_ocr=False):
+    return join_pages(extract_pdf(pdf_bytes, pages, dpi, workers, tesseract_cmd, force_ocr, progress))
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Per-provider limits; override with e.g. TAVILY_RATE=2 TAVILY_BURST=4
+DEFAULT_LIMITS = {
+    "openai": {"rate": 8.0, "burst": 16},
+    "tavily": {"rate": 4.0, "burst": 8},
+    "gemini": {"rate": 4.0, "burst": 8},
+}
+MAX_RETRIES = int(os.environ.get("SCHEDULER_MAX_RETRIES", 4))
+BACKOFF_BASE = float(os.environ.get("SCHEDULER_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("SCHEDULER_BACKOFF_MAX", 20.0))
+BREAKER_WINDOW = int(os.environ.get("SCHEDULER_BREAKER_WINDOW", 20))
+BREAKER_FAILURE_RATIO = float(os.environ.get("SCHEDULER_BREAKER_FAILURE_RATIO", 0.5))
+BREAKER_RESET = float(os.environ.get("SCHEDULER_BREAKER_RESET", 30.0))
+
+_RETRYABLE_STATUS = re.compile(r"\b(408|409|425|429|5\d\d)\b")
+_RETRYABLE_WORDS = ("rate limit", "ratelimit", "too many requests", "timed out", "timeout",
+                    "temporarily", "overloaded", "connection", "resource exhausted", "usagelimitexceeded")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def status_code(exc):
+    for candidate in (exc, getattr(exc, "response", None)):
+        for attr in ("status_code", "code", "status"):
+            value = getattr(candidate, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_retryable(exc):
+    # 429s, 5xx, timeouts and dropped connections are worth another try;
+    # bad requests and auth errors are not
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    code = status_code(exc)
+    if code is not None:
+        return code in (408, 409, 425, 429) or code >= 500
+    message = f"{type(exc).__name__} {exc}".lower()
+    return bool(_RETRYABLE_STATUS.search(message)) or any(word in message for word in _RETRYABLE_WORDS)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        # Take a token now and return how long the caller must wait for it.
+        # Tokens may go negative, which queues callers fairly in arrival order.
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_take(self):
+        # Take a token only if one is free right now; never queues
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    # Opens when at least `failure_ratio` of the last `window` attempts failed,
+    # then lets a single trial call through once `reset_timeout` has passed.
+    # A ratio rather than a streak, so scattered 429s under heavy concurrency
+    # are left to backoff and only a provider that is really down trips it.
+    def __init__(self, window=BREAKER_WINDOW, failure_ratio=BREAKER_FAILURE_RATIO, reset_timeout=BREAKER_RESET):
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open":
+                return False
+            if self.state == "half-open":
+                # Push the window forward so only one trial goes through
+                self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.outcomes.append(True)
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            if self.opened_at is not None:
+                self.opened_at = time.monotonic()  # the half-open trial failed
+            elif len(self.outcomes) == self.outcomes.maxlen:
+                if self.outcomes.count(False) >= self.failure_ratio * len(self.outcomes):
+                    self.opened_at = time.monotonic()
+                    self.outcomes.clear()
+
+
+class ProviderStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+
+    def as_dict(self):
+        return {k: round(v, 3) if isinstance(v, float) else v for k, v in vars(self).items()}
+
+
+class CallScheduler:
+    """Rate limiting, retries with jittered backoff, hedging and circuit
+    breaking for calls to external providers.
+
+    Limits and breakers are tracked per (provider, key) so separate API keys
+    get separate quotas.
+    """
+
+    def __init__(self, limits=None, max_retries=MAX_RETRIES):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+    def _limit(self, provider):
+        limit = dict(self.limits.get(provider, {"rate": 10.0, "burst": 20}))
+        env = provider.upper()
+        limit["rate"] = float(os.environ.get(f"{env}_RATE", limit["rate"]))
+        limit["burst"] = int(os.environ.get(f"{env}_BURST", limit["burst"]))
+        return limit
+
+    def _state(self, provider, key):
+        with self._lock:
+            if (provider, key) not in self._buckets:
+                limit = self._limit(provider)
+                self._buckets[(provider, key)] = TokenBucket(limit["rate"], limit["burst"])
+                self._breakers[(provider, key)] = CircuitBreaker()
+                self._stats.setdefault(provider, ProviderStats())
+            return self._buckets[(provider, key)], self._breakers[(provider, key)], self._stats[provider]
+
+    def stats(self):
+        return {provider: stats.as_dict() for provider, stats in self._stats.items()}
+
+    def _admit(self, provider, breaker, stats):
+        if not breaker.allow():
+            stats.rejected += 1
+            raise CircuitOpenError(f"{provider} circuit is open after repeated failures")
+        stats.calls += 1
+
+    def _failed(self, provider, attempt, exc, breaker, stats):
+        # Returns the backoff delay, or re-raises when the call should not be retried
+        retryable = is_retryable(exc)
+        if retryable:
+            breaker.record_failure()
+        if not retryable or attempt >= self.max_retries:
+            stats.failures += 1
+            logger.warning("%s call failed after %d attempt(s): %s", provider, attempt + 1, exc)
+            raise exc
+        stats.retries += 1
+        delay = backoff_delay(attempt)
+        logger.info("%s call failed (%s); retrying in %.2fs", provider, exc, delay)
+        return delay
+
+    def call(self, provider, fn, *args, key=None, hedge_after=None, **kwargs):
+        bucket, breaker, stats = self._state(provider, key)
+        for attempt in range(self.max_retries + 1):
+            self._admit(provider, breaker, stats)
+            wait_for = bucket.reserve()
+            if wait_for:
+                stats.throttled_seconds += wait_for
+                time.sleep(wait_for)
+            try:
+                if hedge_after is None:
+                    result = fn(*args, **kwargs)
+                else:
+                    result = self._hedged(fn, args, kwargs, hedge_after, bucket, stats)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                time.sleep(self._failed(provider, attempt, e, breaker, stats))
+
+    def _hedged(self, fn, args, kwargs, hedge_after, bucket, stats):
+        # Start a second identical request if the first is slow; first answer wins.
+        # Only use this for idempotent calls (searches, temperature-0 prompts).
+        first = self._hedge_pool.submit(fn, *args, **kwargs)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        if not bucket.try_take():
+            # No spare quota for a hedge; just wait for the original request
+            return first.result()
+        stats.hedges += 1
+        second = self._hedge_pool.submit(fn, *args, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def acall(self, provider, fn, *args, key=None, hedge_after=None, **kwargs):
+        # Async counterpart of call(); fn returns an awaitable
+        bucket, breaker, stats = self._state(provider, key)
+        for attempt in range(self.max_retries + 1):
+            self._admit(provider, breaker, stats)
+            wait_for = bucket.reserve()
+            if wait_for:
+                stats.throttled_seconds += wait_for
+                await asyncio.sleep(wait_for)
+            try:
+                if hedge_after is None:
+                    result = await fn(*args, **kwargs)
+                else:
+                    result = await self._ahedged(fn, args, kwargs, hedge_after, bucket, stats)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                await asyncio.sleep(self._failed(provider, attempt, e, breaker, stats))
+
+    async def _ahedged(self, fn, args, kwargs, hedge_after, bucket, stats):
+        first = asyncio.ensure_future(fn(*args, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done or not bucket.try_take():
+            return await first
+        stats.hedges += 1
+        pending = {first, asyncio.ensure_future(fn(*args, **kwargs))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def raise_embedded_error(result):
+    # TavilySearch returns {"error": exc} instead of raising; surface it so
+    # the scheduler can retry instead of treating it as an empty result
+    if isinstance(result, dict) and "error" in result and "results" not in result:
+        error = result["error"]
+        raise error if isinstance(error, Exception) else RuntimeError(str(error))
+    return result
+
+
+class ScheduledClient:
+    """Routes a search client's calls (search/invoke and their async forms)
+    through a CallScheduler. Other attributes pass through to the client."""
+
+    def __init__(self, client, provider, key=None, hedge_after=None, scheduler=None):
+        self.client = client
+        self.provider = provider
+        self.key = key
+        self.hedge_after = hedge_after
+        self.scheduler = scheduler or call_scheduler
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def search(self, query, **params):
+        return self.scheduler.call(self.provider, lambda: raise_embedded_error(self.client.search(query=query, **params)),
+                                   key=self.key, hedge_after=self.hedge_after)
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.scheduler.call(self.provider, lambda: raise_embedded_error(self.client.invoke(input, config, **kwargs)),
+                                   key=self.key, hedge_after=self.hedge_after)
+
+    async def asearch(self, query, **params):
+        async def run():
+            result = self.client.search(query=query, **params)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return raise_embedded_error(result)
+        return await self.scheduler.acall(self.provider, run, key=self.key, hedge_after=self.hedge_after)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        async def run():
+            return raise_embedded_error(await self.client.ainvoke(input, config, **kwargs))
+        return await self.scheduler.acall(self.provider, run, key=self.key, hedge_after=self.hedge_after)
+
+
+call_scheduler = CallScheduler()
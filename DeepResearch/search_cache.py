@@ -0,0 +1,123 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+import time
+
+from cache import DiskCache, cache_path
+from telemetry import payload_bytes, record
+
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 24 * 60 * 60))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Search parameters that change the result set and so belong in the cache key
+KEY_PARAMS = ("search_depth", "max_results", "topic", "include_domains", "exclude_domains", "time_range")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(cache_path("search.sqlite3"), ttl=SEARCH_CACHE_TTL, max_bytes=SEARCH_CACHE_MAX_BYTES)
+        return _cache
+
+
+def normalize_query(query):
+    # "What is RAG?" and "  what is  rag " should share a cache entry
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def cacheable(results):
+    # Empty results and TavilySearch's {"error": ...} replies must not be
+    # served again from the cache
+    if isinstance(results, dict) and "error" in results and "results" not in results:
+        return False
+    return bool(results)
+
+
+def search_key(query, params):
+    payload = {"query": normalize_query(query)}
+    payload.update({k: v for k, v in params.items() if v is not None})
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CachedSearchClient:
+    """Drop-in wrapper for TavilyClient (``search``) and TavilySearch (``invoke``).
+
+    ``key_params`` adds caller context that is not visible on the client, such
+    as the search focus, to every cache key.
+    """
+
+    def __init__(self, client, cache=None, **key_params):
+        self.client = client
+        self.cache = cache if cache is not None else get_search_cache()
+        self.key_params = key_params
+
+    def _client_params(self):
+        # TavilySearch keeps its settings as attributes rather than call arguments
+        return {name: getattr(self.client, name, None) for name in KEY_PARAMS}
+
+    def _cached(self, query, params, fetch):
+        key = search_key(query, {**self.key_params, **params})
+        results = self.cache.get_json(key)
+        if results is None:
+            start = time.perf_counter()
+            results = fetch()
+            record(search_calls=1, search_seconds=time.perf_counter() - start)
+            if cacheable(results):
+                self.cache.set_json(key, results)
+        else:
+            record(search_cache_hits=1)
+        record(search_bytes=payload_bytes(results))
+        return results
+
+    def search(self, query, **params):
+        return self._cached(query, params, lambda: self.client.search(query=query, **params))
+
+    def invoke(self, input, config=None, **kwargs):
+        query = input.get("query", "") if isinstance(input, dict) else str(input)
+        params = self._client_params()
+        if isinstance(input, dict):
+            params.update({k: v for k, v in input.items() if k != "query"})
+        return self._cached(query, params, lambda: self.client.invoke(input, config, **kwargs))
+
+    # Async variants; the SQLite lookup is fast enough to stay on the event loop
+    async def _acached(self, query, params, fetch):
+        key = search_key(query, {**self.key_params, **params})
+        results = self.cache.get_json(key)
+        if results is None:
+            start = time.perf_counter()
+            results = fetch()
+            if inspect.isawaitable(results):
+                results = await results
+            record(search_calls=1, search_seconds=time.perf_counter() - start)
+            if cacheable(results):
+                self.cache.set_json(key, results)
+        else:
+            record(search_cache_hits=1)
+        record(search_bytes=payload_bytes(results))
+        return results
+
+    async def asearch(self, query, **params):
+        # Works with AsyncTavilyClient (awaitable search), wrappers that expose
+        # asearch and sync clients alike
+        search = getattr(self.client, "asearch", None) or self.client.search
+        return await self._acached(query, params, lambda: search(query=query, **params))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        query = input.get("query", "") if isinstance(input, dict) else str(input)
+        params = self._client_params()
+        if isinstance(input, dict):
+            params.update({k: v for k, v in input.items() if k != "query"})
+        return await self._acached(query, params, lambda: self.client.ainvoke(input, config, **kwargs))
+
+    @property
+    def stats(self):
+        return self.cache.stats
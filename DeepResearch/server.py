@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+
+from graph import graph
+from telemetry import render_metrics, tracing
+
+# Minimal asyncio HTTP job API around graph.ainvoke. Every job runs in one
+# event loop; MAX_CONCURRENT_JOBS caps how many research runs are in flight.
+#
+#   POST /jobs        {"query": "...", "search_focus": "General Web", "research_depth": "quick"} -> {"id": ...}
+#   GET  /jobs/<id>   -> {"status": "queued|running|done|failed", ...} (404 once evicted)
+#   GET  /health      -> {"jobs": ..., "running": ...}
+#   GET  /metrics     -> per-node metrics in Prometheus text format
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 100))
+# Finished jobs are kept for polling until they are JOB_TTL seconds old or
+# more than MAX_FINISHED_JOBS have finished after them
+JOB_TTL = float(os.environ.get("JOB_TTL", 60 * 60))
+MAX_FINISHED_JOBS = int(os.environ.get("MAX_FINISHED_JOBS", 1000))
+# Forwarded from the request body into config["configurable"]
+JOB_OPTIONS = ("search_focus", "max_sub_queries", "search_concurrency", "search_timeout", "max_results",
+               "research_depth", "max_rounds", "time_budget", "token_budget", "search_budget", "min_gain")
+
+
+class JobServer:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, configurable=None, job_ttl=JOB_TTL,
+                 max_finished=MAX_FINISHED_JOBS):
+        self.jobs = {}
+        self.running = 0
+        self.configurable = configurable or {}
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+        self._finished = deque()  # (finish time, job id), oldest first
+        self._limiter = asyncio.Semaphore(max_concurrent)
+        self._tasks = set()
+
+    def submit(self, body):
+        self.evict()
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {"id": job_id, "status": "queued", "query": body["query"], "submitted": time.time()}
+        task = asyncio.create_task(self._run(job_id, body))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def _run(self, job_id, body):
+        job = self.jobs[job_id]
+        configurable = {**self.configurable, "thread_id": job_id}
+        configurable.update({k: body[k] for k in JOB_OPTIONS if k in body})
+        async with self._limiter:
+            job["status"] = "running"
+            self.running += 1
+            started = time.perf_counter()
+            trace = None
+            try:
+                inputs = {"query": body["query"], "chat_history": []}
+                with tracing(job_id) as trace:
+                    state = await graph.ainvoke(inputs, config={"configurable": configurable})
+                job.update(status="done", response=state.get("response", ""))
+            except Exception as e:
+                job.update(status="failed", error=str(e))
+            finally:
+                # Per-node spans, so a slow job shows which stage held it up
+                job["trace"] = trace.to_dict()["spans"] if trace else []
+                self.running -= 1
+                job["seconds"] = round(time.perf_counter() - started, 3)
+                self._finished.append((time.monotonic(), job_id))
+                # The answer is kept on the job; nothing reads the thread again
+                await graph.checkpointer.adelete_thread(job_id)
+
+    def evict(self):
+        # Drop finished jobs past their TTL or beyond the cap; queued and
+        # running jobs are never in _finished
+        cutoff = time.monotonic() - self.job_ttl
+        while self._finished and (self._finished[0][0] < cutoff or len(self._finished) > self.max_finished):
+            _, job_id = self._finished.popleft()
+            self.jobs.pop(job_id, None)
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, payload = self.route(request_line[0], request_line[1], body)
+        except Exception as e:
+            status, payload = 400, {"error": str(e)}
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + data
+        )
+        await writer.drain()
+        writer.close()
+
+    def route(self, method, path, body):
+        if method == "POST" and path == "/jobs":
+            request = json.loads(body or b"{}")
+            if not request.get("query"):
+                return 400, {"error": "query is required"}
+            return 202, {"id": self.submit(request)}
+        if method == "GET" and path.startswith("/jobs/"):
+            self.evict()
+            job = self.jobs.get(path[len("/jobs/"):])
+            return (200, job) if job else (404, {"error": "unknown job"})
+        if method == "GET" and path == "/health":
+            self.evict()
+            return 200, {"jobs": len(self.jobs), "running": self.running}
+        if method == "GET" and path == "/metrics":
+            return 200, render_metrics()
+        return 404, {"error": "not found"}
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepResearch async job API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_JOBS)
+    args = parser.parse_args()
+    print(f"Serving research jobs on http://{args.host}:{args.port} (max {args.max_concurrent} concurrent)")
+    asyncio.run(JobServer(args.max_concurrent).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
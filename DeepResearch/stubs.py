@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local, deterministic stand-ins for the external services. These never touch
+# the network, so they can be used in tests and offline benchmarks.
+
+
+class FakeSearchClient:
+    """Tavily-compatible search client returning deterministic fake results.
+
+    Set ``error`` to an exception to make searches fail: ``search`` raises it,
+    while ``invoke`` returns ``{"error": ...}`` as TavilySearch does.
+    """
+
+    def __init__(self, latency=0.0, results_per_query=5, error=None):
+        self.latency = latency
+        self.results_per_query = results_per_query
+        self.error = error
+        self.calls = 0
+
+    def search(self, query, search_depth="basic", max_results=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self._response(query, search_depth, max_results)
+
+    async def asearch(self, query, search_depth="basic", max_results=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self._response(query, search_depth, max_results)
+
+    def _response(self, query, search_depth, max_results):
+        count = max_results or self.results_per_query
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        results = [
+            {
+                "title": f"Result {i + 1} for {query}",
+                "url": f"https://example.com/{digest}/{i + 1}",
+                "content": f"Snippet {i + 1} about {query} ({search_depth} search).",
+                "score": round(1.0 - i / (count + 1), 3),
+            }
+            for i in range(count)
+        ]
+        return {"query": query, "results": results, "response_time": self.latency}
+
+    def invoke(self, input, config=None, **kwargs):
+        try:
+            if isinstance(input, dict):
+                return self.search(**input)
+            return self.search(str(input))
+        except Exception as e:
+            return {"error": e}
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        try:
+            if isinstance(input, dict):
+                return await self.asearch(**input)
+            return await self.asearch(str(input))
+        except Exception as e:
+            return {"error": e}
+
+
+class _GeminiUsage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _GeminiResponse:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = _GeminiUsage(prompt, text)
+
+
+class FakeGeminiModel:
+    """Stand-in for google.generativeai.GenerativeModel (generate_content and
+    generate_content_async) answering with stub_completion after ``latency``."""
+
+    def __init__(self, latency=0.0, words=120):
+        self.latency = latency
+        self.words = words
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return _GeminiResponse(str(prompt), stub_completion(str(prompt), self.words))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _GeminiResponse(str(prompt), stub_completion(str(prompt), self.words))
+
+
+# --- Stub model output ---
+def stub_completion(prompt, words=120):
+    # Deterministic text shaped like what each node expects back
+    if "search query generator" in prompt:
+        # One query per plan step listed in the prompt, as many as asked for
+        limit = re.search(r"up to (\d+)", prompt)
+        query = re.search(r"^Query: (.*)$", prompt, re.MULTILINE)
+        steps = re.findall(r"^\s*(?:\d+[.)]|[-*•])\s+(.+)$", prompt.split("Plan:", 1)[-1], re.MULTILINE)
+        return "\n".join(f"{query.group(1) if query else 'research'} {step}" for step in steps[:int(limit.group(1)) if limit else 3])
+    if "research planner" in prompt or "planning agent" in prompt:
+        return "1. Background and definitions\n2. Current methods\n3. Open problems"
+    if "'fresh' or 'follow-up'" in prompt:
+        return "fresh"
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return " ".join(f"word{digest[i % 64]}{i}" for i in range(words))
+
+
+# --- Stub HTTP server ---
+class _StubHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 would serialize bursts of concurrent clients
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubServer:
+    """Local HTTP server speaking the OpenAI chat-completions and Tavily search APIs.
+
+    Point get_llm at ``url + "/v1"`` (openai_base_url) and get_tavily_tool at
+    ``url`` (tavily_base_url). Each request sleeps for the configured latency,
+    so concurrency behaves like it would against the real services.
+
+    For fault injection, ``fail_rate`` of requests get a 429 with Retry-After
+    and ``slow_rate`` of them take ``slow_latency`` instead (a latency tail).
+    The faults come from a seeded RNG, so runs are repeatable.
+    """
+
+    def __init__(self, llm_latency=0.05, search_latency=0.05, host="127.0.0.1", port=0,
+                 fail_rate=0.0, slow_rate=0.0, slow_latency=1.0, seed=0):
+        self.llm_latency = llm_latency
+        self.search_latency = search_latency
+        self.fail_rate = fail_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.rejected = 0
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.search = FakeSearchClient()
+        self._server = _StubHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _fault(self, latency):
+        # Returns (reject, latency) for the next request
+        with self._rng_lock:
+            reject = self._rng.random() < self.fail_rate
+            slow = self._rng.random() < self.slow_rate
+        if reject:
+            self.rejected += 1
+        return reject, self.slow_latency if slow else latency
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                stub.requests += 1
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    latency = stub.llm_latency
+                elif self.path.endswith("/search"):
+                    latency = stub.search_latency
+                else:
+                    self.send_error(404)
+                    return
+                reject, latency = stub._fault(latency)
+                if reject:
+                    self._json({"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                               status=429, headers={"Retry-After": "1"})
+                    return
+                time.sleep(latency)
+                if self.path.endswith("/chat/completions"):
+                    self._chat(body)
+                else:
+                    self._json(stub.search._response(body.get("query", ""), body.get("search_depth", "basic"), body.get("max_results")))
+
+            def _json(self, payload, status=200, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chat(self, body):
+                prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+                text = stub_completion(prompt)
+                model = body.get("model", "stub")
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if not body.get("stream"):
+                    self._json({
+                        "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+                    return
+                # Server-sent events, one word per chunk
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    delta = {"content": word if i == 0 else " " + word}
+                    self._event({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                self._event({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _event(self, payload):
+                self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+        return Handler
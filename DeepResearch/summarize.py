@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tokens import count_tokens, split_tokens
+
+# Chunk sizes are in tokens and sized well below the model context window
+DEFAULT_CHUNK_TOKENS = 3000
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_REDUCE_TOKENS = 6000
+DEFAULT_SUMMARY_WORKERS = 4
+
+MAP_PROMPT = (
+    "Summarize the following section ({index} of {total}) of a longer document. "
+    "Keep key findings, figures, methods and named entities.\n\n{text}"
+)
+COMBINE_PROMPT = (
+    "Combine the following partial summaries of consecutive sections of one document "
+    "into a single summary, keeping every key point and their order.\n\n{text}"
+)
+FINAL_PROMPT = "Please provide a comprehensive summary of the following text:\n\n{text}"
+
+
+def _run_batch(complete, prompts, workers, stage, progress):
+    # Runs prompts on a bounded pool and returns the completions in input order
+    results = [None] * len(prompts)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prompts)))) as pool:
+        futures = {pool.submit(complete, prompt): i for i, prompt in enumerate(prompts)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(stage, done, len(prompts))
+    return results
+
+
+def _group(summaries, max_tokens):
+    # Pack consecutive summaries into groups that each fit in one combine prompt
+    groups, current, size = [], [], 0
+    for summary in summaries:
+        tokens = count_tokens(summary)
+        if current and size + tokens > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_document(text, complete, final_prompt=FINAL_PROMPT, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                       overlap=DEFAULT_CHUNK_OVERLAP, reduce_tokens=DEFAULT_REDUCE_TOKENS,
+                       workers=DEFAULT_SUMMARY_WORKERS, progress=None):
+    # Map-reduce summary of arbitrarily long text.
+    # complete(prompt) -> str calls the model; progress(stage, done, total) reports
+    # "map", "reduce" and "final" steps.
+    if count_tokens(text) <= chunk_tokens:
+        summary = complete(final_prompt.format(text=text))
+        if progress:
+            progress("final", 1, 1)
+        return summary
+
+    chunks = split_tokens(text, chunk_tokens, overlap)
+    prompts = [MAP_PROMPT.format(index=i + 1, total=len(chunks), text=chunk) for i, chunk in enumerate(chunks)]
+    summaries = _run_batch(complete, prompts, workers, "map", progress)
+
+    # Combine neighbouring summaries level by level until one final prompt fits
+    while len(summaries) > 1 and count_tokens("\n\n".join(summaries)) > reduce_tokens:
+        groups = _group(summaries, reduce_tokens)
+        if len(groups) == len(summaries):
+            # Every summary already fills a prompt on its own; pair them up so each level still shrinks
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        prompts = [COMBINE_PROMPT.format(text="\n\n".join(group)) for group in groups]
+        summaries = _run_batch(complete, prompts, workers, "reduce", progress)
+
+    summary = complete(final_prompt.format(text="\n\n".join(summaries)))
+    if progress:
+        progress("final", 1, 1)
+    return summary
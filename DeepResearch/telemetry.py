@@ -0,0 +1,256 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Per-node instrumentation. Every node runs inside a span that records wall
+# time plus counters (LLM tokens, searches, cache and index hits, bytes)
+# reported by the code it calls. Finished spans are
+#   - logged as one JSON object per line on the "deepresearch.trace" logger
+#     (set TRACE_LOG_FILE to write them to a file),
+#   - aggregated into Prometheus-style metrics (render_metrics(), GET /metrics
+#     on server.py, or the METRICS_FILE textfile),
+#   - collected into the current request's Trace, if one is active.
+
+logger = logging.getLogger("deepresearch.trace")
+
+TRACE_LOG_FILE = os.environ.get("TRACE_LOG_FILE")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+
+COUNTERS = (
+    "llm_calls", "prompt_tokens", "completion_tokens", "llm_cache_hits",
+    "search_calls", "search_seconds", "search_cache_hits", "index_hits", "search_bytes", "output_bytes",
+)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+_current_span = contextvars.ContextVar("deepresearch_span", default=None)
+_current_trace = contextvars.ContextVar("deepresearch_trace", default=None)
+
+if TRACE_LOG_FILE:
+    _handler = logging.FileHandler(TRACE_LOG_FILE, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+class Span:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.started = time.time()
+        self.seconds = 0.0
+        self.error = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        # Searches run on worker threads, so updates may race
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "span": self.name,
+            "parent": self.parent,
+            "started": round(self.started, 3),
+            "seconds": round(self.seconds, 4),
+            **{k: round(v, 4) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "error": self.error,
+        }
+
+
+class Trace:
+    """All spans of one research request, in the order they finished."""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or str(uuid.uuid4())
+        self.spans = []
+        self._start = time.perf_counter()
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {"request_id": self.request_id, "seconds": round(self.seconds, 3),
+                "spans": [span.to_dict() for span in self.spans]}
+
+
+class Metrics:
+    """Process-wide aggregates per span name, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, span):
+        with self._lock:
+            node = self._nodes.setdefault(span.name, {
+                "count": 0, "errors": 0, "seconds": 0.0, "buckets": [0] * len(LATENCY_BUCKETS),
+                "counters": dict.fromkeys(COUNTERS, 0),
+            })
+            node["count"] += 1
+            node["errors"] += span.error is not None
+            node["seconds"] += span.seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if span.seconds <= bound:
+                    node["buckets"][i] += 1
+            for name, value in span.counters.items():
+                node["counters"][name] = node["counters"].get(name, 0) + value
+
+    def render(self):
+        with self._lock:
+            nodes = json.loads(json.dumps(self._nodes))
+        lines = [
+            "# HELP deepresearch_node_seconds Wall time per pipeline node.",
+            "# TYPE deepresearch_node_seconds histogram",
+        ]
+        for name, node in sorted(nodes.items()):
+            for bound, count in zip(LATENCY_BUCKETS, node["buckets"]):
+                lines.append(f'deepresearch_node_seconds_bucket{{node="{name}",le="{bound}"}} {count}')
+            lines.append(f'deepresearch_node_seconds_bucket{{node="{name}",le="+Inf"}} {node["count"]}')
+            lines.append(f'deepresearch_node_seconds_sum{{node="{name}"}} {node["seconds"]:.6f}')
+            lines.append(f'deepresearch_node_seconds_count{{node="{name}"}} {node["count"]}')
+        lines.append("# TYPE deepresearch_node_errors_total counter")
+        for name, node in sorted(nodes.items()):
+            lines.append(f'deepresearch_node_errors_total{{node="{name}"}} {node["errors"]}')
+        for counter in COUNTERS:
+            lines.append(f"# TYPE deepresearch_{counter}_total counter")
+            for name, node in sorted(nodes.items()):
+                lines.append(f'deepresearch_{counter}_total{{node="{name}"}} {node["counters"].get(counter, 0):g}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._nodes.clear()
+
+
+metrics = Metrics()
+
+
+def render_metrics():
+    return metrics.render()
+
+
+def write_metrics(path):
+    # Written atomically for node_exporter's textfile collector
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(tmp, path)
+
+
+def record(**counters):
+    # Adds to the innermost active span; a no-op outside of one
+    span = _current_span.get()
+    if span is not None:
+        span.add(**counters)
+
+
+def payload_bytes(value):
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+@contextmanager
+def span(name):
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else None)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        metrics.observe(current)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(current)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"request_id": trace.request_id if trace else None, **current.to_dict()}))
+        if METRICS_FILE:
+            try:
+                write_metrics(METRICS_FILE)
+            except OSError as e:
+                logger.warning("could not write %s: %s", METRICS_FILE, e)
+
+
+@contextmanager
+def tracing(request_id=None, trace=None):
+    # Collects the spans of every node run while the block is active,
+    # including nodes that LangGraph runs on worker threads. Pass an
+    # existing trace to add later work (e.g. title generation) to it.
+    trace = trace or Trace(request_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.seconds = time.perf_counter() - trace._start
+        _current_trace.reset(token)
+
+
+def traced(name, fn):
+    # Wraps a sync or async node function in a span and records the size of
+    # its state update
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = await fn(*args, **kwargs)
+                current.add(output_bytes=payload_bytes(result))
+                return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = fn(*args, **kwargs)
+                current.add(output_bytes=payload_bytes(result))
+                return result
+    return wrapper
+
+
+def in_context(fn):
+    # Bind fn to the caller's context, so spans stay visible on pool threads
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+# generation_info flag on generations served by llm_cache.ResponseCache
+CACHE_HIT = "llm_cache_hit"
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Adds LLM calls and token usage to the active span."""
+
+    def on_llm_end(self, response, **kwargs):
+        generations = [g for gs in response.generations for g in gs]
+        if generations and all((g.generation_info or {}).get(CACHE_HIT) for g in generations):
+            # No request was made; the cache already recorded llm_cache_hits
+            return
+        prompt_tokens = completion_tokens = 0
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            # Streaming and cached responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+        record(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+token_usage_handler = TokenUsageHandler()
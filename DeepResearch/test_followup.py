@@ -0,0 +1,38 @@
+import pytest
+
+from benchmark import FOLLOWUP_ANSWERS, FOLLOWUP_CASES
+from followup import FOLLOWUP, FRESH, classify
+
+# Run with: python -m pytest test_followup.py
+
+BATTERIES = "How do solid state batteries work?"
+
+
+@pytest.mark.parametrize("previous_query, previous_response, query, is_follow_up", FOLLOWUP_CASES)
+def test_local_decisions_are_correct(previous_query, previous_response, query, is_follow_up):
+    # None hands the query to the LLM, which is always allowed
+    decision = classify(query, previous_query, previous_response)
+    if decision is not None:
+        assert (decision == FOLLOWUP) == is_follow_up
+
+
+@pytest.mark.parametrize("query", [
+    "Effects of intermittent fasting on insulin sensitivity in adults",
+    "What is the current state of fusion energy research?",
+    "Health effects of air pollution from mining",
+    "Economic impact of electric vehicle policy in Europe",
+])
+def test_common_words_in_a_long_answer_are_not_a_follow_up(query):
+    # Each shares a few words with the battery answer, none of them its topic
+    assert classify(query, BATTERIES, FOLLOWUP_ANSWERS[BATTERIES]) != FOLLOWUP
+
+
+def test_follow_up_on_the_topic_of_a_long_answer():
+    answer = FOLLOWUP_ANSWERS[BATTERIES]
+    assert classify("What are the manufacturing challenges of these batteries?", BATTERIES, answer) == FOLLOWUP
+    # Details mentioned in passing score in between and are left to the LLM
+    assert classify("Why are sulfide electrolytes sensitive to moisture?", BATTERIES, answer) != FRESH
+
+
+def test_unrelated_query_is_fresh():
+    assert classify("Who invented the printing press and when?", BATTERIES, FOLLOWUP_ANSWERS[BATTERIES]) == FRESH
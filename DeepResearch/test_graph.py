@@ -1,21 +1,33 @@
 import os
+import sys
 from dotenv import load_dotenv
 from graph import graph
+from stubs import StubServer
 import uuid
 
 load_dotenv()
 
-def test_graph():
-    if not os.environ.get("GOOGLE_API_KEY"):
-        print("Error: GOOGLE_API_KEY not found in environment.")
+def test_graph(stub=False):
+    # With stub=True (python test_graph.py --stub) the graph runs against the
+    # local StubServer instead of OpenAI/Tavily, so no keys or network are needed
+    server = None
+    if stub:
+        server = StubServer().start()
+    elif not os.environ.get("OPENAI_API_KEY"):
+        print("Error: OPENAI_API_KEY not found in environment.")
         return
-    if not os.environ.get("TAVILY_API_KEY"):
+    elif not os.environ.get("TAVILY_API_KEY"):
         print("Error: TAVILY_API_KEY not found in environment.")
         return
 
     print("Starting Graph Test...")
     thread_id = str(uuid.uuid4())
     config = {"configurable": {"thread_id": thread_id}}
+    if server:
+        config["configurable"].update({
+            "openai_api_key": "sk-stub", "tavily_api_key": "tvly-stub",
+            "openai_base_url": server.url + "/v1", "tavily_base_url": server.url,
+        })
     
     query = "What is the capital of France?"
     print(f"Query: {query}")
@@ -31,6 +43,9 @@ def test_graph():
         print("\nTest Complete.")
     except Exception as e:
         print(f"Graph execution failed: {e}")
+    finally:
+        if server:
+            server.stop()
 
 if __name__ == "__main__":
-    test_graph()
+    test_graph(stub="--stub" in sys.argv)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from cache import DiskCache
+from search_cache import CachedSearchClient
+from stubs import FakeSearchClient
+
+# Run with: python -m pytest test_search_cache.py
+
+
+@pytest.fixture
+def client():
+    return FakeSearchClient()
+
+
+@pytest.fixture
+def cached(client, tmp_path):
+    return CachedSearchClient(client, DiskCache(str(tmp_path / "search.sqlite3"), ttl=60))
+
+
+def test_repeated_query_is_a_cache_hit(client, cached):
+    first = cached.search("What is RAG?", max_results=3)
+    second = cached.search("  what is  rag ", max_results=3)
+    assert second == first
+    assert client.calls == 1
+    assert (cached.stats.hits, cached.stats.misses) == (1, 1)
+
+
+def test_async_search_shares_entries(client, cached):
+    first = cached.search("vector databases")
+    second = asyncio.run(cached.asearch("Vector databases?"))
+    assert second == first
+    assert client.calls == 1
+
+
+def test_max_results_is_part_of_the_key(client, cached):
+    assert len(cached.search("LLM agents", max_results=3)["results"]) == 3
+    assert len(cached.search("LLM agents", max_results=5)["results"]) == 5
+    assert client.calls == 2
+    cached.search("LLM agents", max_results=5)
+    assert client.calls == 2
+
+
+def test_invoke_uses_max_results_from_the_input(client, cached):
+    cached.invoke({"query": "LLM agents", "max_results": 3})
+    cached.invoke({"query": "LLM agents", "max_results": 8})
+    cached.invoke({"query": "LLM agents", "max_results": 8})
+    assert client.calls == 2
+
+
+def test_raised_errors_are_not_cached(client, cached):
+    client.error = RuntimeError("429 Too Many Requests")
+    with pytest.raises(RuntimeError):
+        cached.search("What is RAG?")
+    client.error = None
+    assert cached.search("What is RAG?")["results"]
+    assert client.calls == 2
+
+
+def test_error_replies_are_not_cached(client, cached):
+    client.error = RuntimeError("429 Too Many Requests")
+    assert "error" in cached.invoke({"query": "What is RAG?"})
+    assert "error" in asyncio.run(cached.ainvoke({"query": "What is RAG?"}))
+    client.error = None
+    assert cached.invoke({"query": "What is RAG?"})["results"]
+    assert client.calls == 3
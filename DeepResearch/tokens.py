@@ -0,0 +1,43 @@
+import functools
+
+# Rough characters-per-token ratio used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def split_tokens(text, chunk_tokens, overlap=0):
+    # Windows of at most chunk_tokens tokens, each repeating the last `overlap`
+    # tokens of the previous one so sentences cut at a boundary keep context
+    if chunk_tokens <= overlap:
+        raise ValueError("chunk_tokens must be larger than overlap")
+    encoding = _encoding()
+    if encoding is None:
+        size, step = chunk_tokens * CHARS_PER_TOKEN, (chunk_tokens - overlap) * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, max(len(text) - overlap * CHARS_PER_TOKEN, 1), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    step = chunk_tokens - overlap
+    return [encoding.decode(tokens[i:i + chunk_tokens]) for i in range(0, max(len(tokens) - overlap, 1), step)]
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writing process per directory
+    fcntl = None
+
+from cache import cache_path
+from followup import terms
+from tokens import split_tokens
+
+# Local corpus of previously fetched sources (search results, PDF text) for
+# retrieval before going out to Tavily. Chunks are embedded with feature
+# hashing (unigrams + bigrams into EMBED_DIM signed buckets), which needs no
+# model or API call and is good enough to recognise a topic seen before.
+EMBED_DIM = int(os.environ.get("INDEX_EMBED_DIM", 256))
+CHUNK_TOKENS = 200
+CHUNK_OVERLAP = 20
+# Chunks older than this are ignored and dropped on the next compaction
+INDEX_TTL = float(os.environ.get("INDEX_TTL", 7 * 24 * 60 * 60))
+
+# Coverage: a query is answered locally only if enough close chunks exist
+# and together they mention nearly all of its terms
+MIN_SCORE = float(os.environ.get("INDEX_MIN_SCORE", 0.3))
+MIN_HITS = 3
+MIN_TERM_COVERAGE = 0.8
+
+
+def _bucket(feature):
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % EMBED_DIM, 1.0 if h & 0x80000000 else -1.0
+
+
+def embed(texts):
+    # (len(texts), EMBED_DIM) float32, rows L2-normalized (zero for empty text)
+    vectors = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = terms(text)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            bucket, sign = _bucket(feature)
+            vectors[row, bucket] += sign
+    # Dampen repeated terms, keeping the hash sign
+    vectors[:] = np.sign(vectors) * np.log1p(np.abs(vectors))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def term_coverage(query, texts):
+    # Share of the query's terms that appear in any of the texts
+    wanted = set(terms(query))
+    if not wanted:
+        return 0.0
+    found = set()
+    for text in texts:
+        found.update(wanted.intersection(terms(text)))
+    return len(found) / len(wanted)
+
+
+class SourceIndex:
+    """Flat inner-product index over chunked source text, kept on disk.
+
+    Vectors are appended to ``vectors.f32`` and searched through a read-only
+    memory map, so the index costs page cache rather than heap; chunk text and
+    metadata live in SQLite next to it. Duplicate chunks are stored once.
+    Chunks added with an ``owner`` (a user's uploaded PDFs) are private and
+    only found by searches for that owner; the rest are shared.
+    Thread-safe, and on POSIX process-safe: the apps, the job server and
+    batch runs share one directory, so appends and compaction hold an
+    exclusive ``flock`` on ``index.lock`` and searches a shared one.
+    """
+
+    def __init__(self, directory, ttl=INDEX_TTL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ttl = ttl
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, "index.lock"), "a")
+        self._matrix = None
+        self._mapped = None
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, digest TEXT UNIQUE NOT NULL, url TEXT NOT NULL, title TEXT NOT NULL, "
+            "source TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL, owner TEXT NOT NULL DEFAULT '')"
+        )
+        with self._locked(exclusive=True):
+            columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(chunks)")}
+            if "owner" not in columns:
+                # Older indexes served uploaded PDFs to every user. Whose they
+                # were is unknown, so they are dropped rather than kept shared
+                self._conn.execute("ALTER TABLE chunks ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+                self._conn.execute("DELETE FROM chunks WHERE source = 'pdf'")
+        with open(self._vectors_path, "ab"):
+            pass
+        self._compact()
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        # Row ids are byte offsets into vectors.f32, so another process must
+        # not append or renumber between reading the file and its rows
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def add(self, text, url="", title="", source="search", owner=""):
+        # Chunk, embed and store a document; returns the number of new chunks.
+        # With an owner, the chunks are private to it (and deduplicated per owner)
+        chunks = [c.strip() for c in split_tokens(text, CHUNK_TOKENS, CHUNK_OVERLAP) if c.strip()]
+        prefix = f"{owner}\0" if owner else ""
+        digests = [hashlib.sha256((prefix + c).encode("utf-8")).hexdigest() for c in chunks]
+        now = time.time()
+        with self._locked(exclusive=True):
+            known = {d for (d,) in self._conn.execute(
+                f"SELECT digest FROM chunks WHERE digest IN ({','.join('?' * len(digests))})", digests
+            )} if digests else set()
+            new = list({d: c for c, d in zip(chunks, digests) if d not in known}.items())
+            if not new:
+                return 0
+            vectors = embed([c for _, c in new])
+            with open(self._vectors_path, "ab") as f:
+                first = f.seek(0, os.SEEK_END) // (EMBED_DIM * 4)
+                f.write(vectors.tobytes())
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (row, digest, url, title, source, text, created, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(first + i, d, url, title, source, c, now, owner) for i, (d, c) in enumerate(new)],
+            )
+            return len(new)
+
+    def add_results(self, results, source="search"):
+        # Tavily-style {"results": [{"url", "title", "content"}, ...]}
+        if isinstance(results, dict):
+            results = results.get("results", [])
+        if not isinstance(results, list):
+            return 0
+        return sum(self.add(r.get("content") or "", r.get("url", ""), r.get("title", ""), source)
+                   for r in results if isinstance(r, dict))
+
+    def search(self, query, k=5, owner=""):
+        # [(score, {"url", "title", "source", "content"})], best first, from
+        # the shared chunks and those private to owner
+        vector = embed([query])[0]
+        with self._locked():
+            matrix = self._load()
+            if matrix is None or not len(matrix):
+                return []
+            scores = matrix @ vector
+            # Twice k candidates, as some may have expired or belong to
+            # another owner; widened until k are usable or none are left
+            candidates = min(k * 2, len(scores))
+            while True:
+                top = np.argpartition(-scores, candidates - 1)[:candidates]
+                top = top[np.argsort(-scores[top])]
+                rows = {row: rest for row, *rest in self._conn.execute(
+                    "SELECT row, url, title, source, text FROM chunks WHERE created >= ? AND owner IN ('', ?) "
+                    f"AND row IN ({','.join('?' * len(top))})",
+                    [time.time() - self.ttl, owner, *map(int, top)],
+                )}
+                if len(rows) >= k or candidates == len(scores) or scores[top[-1]] <= 0:
+                    break
+                candidates = min(candidates * 4, len(scores))
+        hits = []
+        for row in map(int, top):
+            if row in rows and scores[row] > 0:
+                url, title, source, text = rows[row]
+                hits.append((float(scores[row]), {"url": url, "title": title, "source": source, "content": text}))
+        return hits[:k]
+
+    def lookup(self, query, k=5, min_score=MIN_SCORE, owner=""):
+        # Hits that cover the query well enough to skip the web search, else None
+        hits = [(score, hit) for score, hit in self.search(query, k, owner) if score >= min_score]
+        if len(hits) < min(MIN_HITS, k) or term_coverage(query, [h["content"] for _, h in hits]) < MIN_TERM_COVERAGE:
+            return None
+        return [hit for _, hit in hits]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _load(self):
+        # Re-map only when rows were appended or another process compacted
+        # (a new file) since the last search; called under _locked()
+        st = os.stat(self._vectors_path)
+        rows = st.st_size // (EMBED_DIM * 4)
+        if rows == 0:
+            return None
+        if self._matrix is None or self._mapped != (st.st_ino, rows):
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, EMBED_DIM))
+            self._mapped = (st.st_ino, rows)
+        return self._matrix
+
+    def _compact(self):
+        # Drop expired chunks and rewrite the vector file without them
+        with self._locked(exclusive=True):
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE created < ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+            rows = os.path.getsize(self._vectors_path) // (EMBED_DIM * 4)
+            if not expired and rows == self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]:
+                return
+            self._conn.execute("DELETE FROM chunks WHERE created < ?", (time.time() - self.ttl,))
+            keep = [row for (row,) in self._conn.execute("SELECT row FROM chunks ORDER BY row") if row < rows]
+            old = np.fromfile(self._vectors_path, dtype=np.float32).reshape(-1, EMBED_DIM)
+            tmp = self._vectors_path + ".tmp"
+            old[keep].tofile(tmp)
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunks WHERE row >= ?", (rows,))
+            for new_row, row in enumerate(keep):
+                self._conn.execute("UPDATE chunks SET row = ? WHERE row = ?", (-(new_row + 1), row))
+            self._conn.execute("UPDATE chunks SET row = -row - 1")
+            self._conn.execute("COMMIT")
+            os.replace(tmp, self._vectors_path)
+            self._matrix = None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_source_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SourceIndex(cache_path("index"))
+        return _index
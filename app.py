@@ -1,52 +1,52 @@
 import streamlit as st
-import fitz
-from PIL import Image
-import pytesseract
-import io
-import google.generativeai as genai
 import os
+import sys
+
+# Shared helpers (OCR pipeline, ...) live next to the DeepResearch app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "DeepResearch"))
+from pdf_cache import cached_extract_pdf, cached_summary, pdf_cache_stats, pdf_digest
+from summarize import summarize_document
+from pdf_extract import DEFAULT_OCR_DPI, count_pages, extraction_summary, join_pages, parse_page_range
 
 # ----------------------------
 # CONFIGURE GEMINI API
 # ----------------------------
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel("gemini-2.5-flash")
+GEMINI_MODEL = "gemini-2.5-flash"
 
-# ----------------------------
-# TESSERACT PATH (Windows)
-# ----------------------------
-pytesseract.pytesseract.tesseract_cmd = r"C:\Users\Vedan\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
 
+@st.cache_resource
+def get_model():
+    # Configured once per process rather than on every rerun; the SDK itself
+    # is only imported once a prompt or summary needs it
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(GEMINI_MODEL)
 
 # ----------------------------
-# OCR FUNCTION
+# TESSERACT PATH (Windows)
 # ----------------------------
-def extract_text_from_pdf(pdf_bytes):
-    text = ""
-    pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
-
-    for page_num, page in enumerate(pdf):
-        pix = page.get_pixmap()
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        page_text = pytesseract.image_to_string(img)
-        text += f"\n\n--- PAGE {page_num + 1} ---\n"
-        text += page_text
-
-    return text
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", r"C:\Users\Vedan\AppData\Local\Programs\Tesseract-OCR\tesseract.exe")
 
 
 # ----------------------------
 # SUMMARY USING GEMINI
 # ----------------------------
-def summarize_text(text):
-    prompt = f"""
+SUMMARY_PROMPT = """
     Summarize the following PDF content accurately and concisely:
 
     {text}
     """
-    response = model.generate_content(prompt)
-    return response.text
+
+
+def summarize_text(text, progress=None):
+    # Long documents are chunked and summarized in parallel, then merged
+    return summarize_document(
+        text,
+        lambda prompt: get_model().generate_content(prompt).text,
+        final_prompt=SUMMARY_PROMPT,
+        progress=progress,
+    )
 
 
 # ----------------------------
@@ -63,7 +63,7 @@ user_query = st.text_input("Enter your question or prompt")
 
 if user_query:
     st.info("Generating response...")
-    reply = model.generate_content(user_query)
+    reply = get_model().generate_content(user_query)
     st.subheader("💡 Response")
     st.write(reply.text)
 
@@ -77,17 +77,67 @@ st.subheader("📄 Upload PDF for OCR + Summary")
 uploaded_pdf = st.file_uploader("Upload PDF", type=["pdf"])
 
 if uploaded_pdf is not None:
-    st.info("Extracting text using OCR...")
-
     pdf_bytes = uploaded_pdf.read()
-    extracted_text = extract_text_from_pdf(pdf_bytes)
+    page_count = count_pages(pdf_bytes)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        ocr_dpi = st.slider("OCR resolution (DPI)", 72, 300, DEFAULT_OCR_DPI, step=24)
+    with col2:
+        page_spec = st.text_input(f"Pages (e.g. 1-3, 7; blank = all {page_count})")
+    force_ocr = st.checkbox("OCR every page (ignore embedded text layer)")
+
+    try:
+        selected_pages = parse_page_range(page_spec, page_count)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+
+    st.info("Extracting text...")
+    progress_bar = st.progress(0.0)
+
+    def show_progress(done, total):
+        progress_bar.progress(done / total, text=f"Page {done}/{total}")
+
+    # Embedded text is used where present; only scanned pages are OCRed, in parallel.
+    # Pages are cached by PDF hash, so reruns and re-uploads are instant.
+    page_results = cached_extract_pdf(
+        pdf_bytes,
+        pages=selected_pages,
+        dpi=ocr_dpi,
+        tesseract_cmd=TESSERACT_CMD,
+        force_ocr=force_ocr,
+        progress=show_progress,
+    )
+    extracted_text = join_pages(page_results)
+
+    st.caption(extraction_summary(page_results))
+    with st.expander("Per-page extraction details"):
+        st.table([
+            {"page": r.page_number + 1, "method": r.method, "seconds": round(r.seconds, 3), "chars": len(r.text)}
+            for r in page_results
+        ])
 
     st.subheader("📌 Extracted Text")
     st.text_area("", extracted_text, height=250)
 
     if st.button("Generate Summary"):
         st.info("Generating summary using Gemini...")
-        summary = summarize_text(extracted_text)
+        summary_bar = st.progress(0.0)
+
+        def show_summary_progress(stage, done, total):
+            summary_bar.progress(done / total, text=f"Summarizing ({stage} {done}/{total})")
+
+        summary = cached_summary(
+            pdf_digest(pdf_bytes),
+            lambda: summarize_text(extracted_text, show_summary_progress),
+            model=GEMINI_MODEL, pages=selected_pages, dpi=ocr_dpi, force_ocr=force_ocr, method="map-reduce",
+        )
 
         st.subheader("📘 Summary")
         st.write(summary)
+
+# Cache stats go last so they include this run's lookups
+with st.sidebar:
+    st.subheader("🗄️ PDF Cache")
+    st.json(pdf_cache_stats())
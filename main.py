@@ -3,57 +3,136 @@
 # ============================================================
 
 # ------------------------ IMPORTS ---------------------------
-from langgraph.graph import StateGraph, END
-from tavily import TavilyClient
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, TypedDict
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+import asyncio
 import json
+import operator
 import os
+import re
+import sys
+import threading
+
+# Shared helpers (search cache, result compaction, ...) live next to the DeepResearch app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "DeepResearch"))
+from compact import compact_search_results
+from scheduler import ScheduledClient, call_scheduler
+from search_cache import CachedSearchClient
+from telemetry import in_context, record, traced
+from tokens import count_tokens
 
 
 # ============================================================
-# API KEY LOADING
+# API CLIENTS
 # ============================================================
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+# Clients are created on first use, so importing this module needs neither
+# the API keys nor the Gemini/Tavily SDKs (which take most of the startup
+# time); a missing key is reported when the first call needs it. Tests and
+# benchmarks may assign gemini_model / tavily_client / async_tavily_client
+# directly.
+gemini_model = None
+tavily_client = None
+async_tavily_client = None
+_clients_lock = threading.Lock()
+
+# Tavily misses go through the call scheduler (rate limits, 429 retries,
+# hedging of slow searches); repeat queries come from the on-disk search cache
+SEARCH_HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", "5"))
+
+
+def require_key(name):
+    key = os.getenv(name)
+    if not key:
+        raise ValueError(f"❌ {name} NOT FOUND in environment variables")
+    return key
+
+
+def get_gemini_model():
+    global gemini_model
+    with _clients_lock:
+        if gemini_model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=require_key("GOOGLE_API_KEY"))
+            gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+        return gemini_model
+
+
+def get_tavily_client():
+    global tavily_client
+    with _clients_lock:
+        if tavily_client is None:
+            from tavily import TavilyClient
+
+            client = TavilyClient(api_key=require_key("TAVILY_API_KEY"))
+            tavily_client = CachedSearchClient(ScheduledClient(client, "tavily", hedge_after=SEARCH_HEDGE_AFTER))
+        return tavily_client
 
-if not GOOGLE_API_KEY:
-    raise ValueError("❌ GOOGLE_API_KEY NOT FOUND in environment variables")
 
-if not TAVILY_API_KEY:
-    raise ValueError("❌ TAVILY_API_KEY NOT FOUND in environment variables")
+def get_async_tavily_client():
+    global async_tavily_client
+    with _clients_lock:
+        if async_tavily_client is None:
+            from tavily import AsyncTavilyClient
 
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+            client = AsyncTavilyClient(api_key=require_key("TAVILY_API_KEY"))
+            async_tavily_client = CachedSearchClient(ScheduledClient(client, "tavily", hedge_after=SEARCH_HEDGE_AFTER))
+        return async_tavily_client
 
-# Tavily
-tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+# Upper bound on arun_pipeline calls in flight in this process
+MAX_CONCURRENT_PIPELINES = int(os.getenv("MAX_CONCURRENT_PIPELINES", "100"))
+# A semaphore belongs to the loop it was first awaited on, so keep one per
+# loop; a later asyncio.run gets its own instead of a stale one
+_pipeline_limiters = {}
+_pipeline_limiters_lock = threading.Lock()
+
+
+def pipeline_limiter():
+    loop = asyncio.get_running_loop()
+    with _pipeline_limiters_lock:
+        limiter = _pipeline_limiters.get(loop)
+        if limiter is None:
+            # The semaphore references its loop, so closed loops are dropped here
+            for closed in [other for other in _pipeline_limiters if other.is_closed()]:
+                del _pipeline_limiters[closed]
+            limiter = _pipeline_limiters[loop] = asyncio.Semaphore(MAX_CONCURRENT_PIPELINES)
+    return limiter
 
 
 # ============================================================
 # INITIAL STATE STRUCTURE
 # ============================================================
 
+# search_results collects one Tavily response per search; the raw-query and
+# plan-derived searchers run in parallel and both append to it
+class ResearchState(TypedDict):
+    user_query: str
+    plan: str
+    search_results: Annotated[list, operator.add]
+    final_answer: str
+
+
 def create_initial_state(user_query: str):
     return {
         "user_query": user_query,
         "plan": "",
-        "search_results": {},
+        "search_results": [],
         "final_answer": ""
     }
 
 
+# Every agent has a sync and an async variant built from the same prompts,
+# so the pipeline serves both pipeline.invoke and pipeline.ainvoke.
+
 # ============================================================
 # AGENT 1 — PLANNER (Gemini)
 # ============================================================
 
-def planner_agent(state):
-    print("\n================ PLANNER AGENT START ================")
-
-    query = state["user_query"]
-
-    prompt = f"""
+def planner_prompt(query):
+    return f"""
 You are a planning agent. Break down the topic into clear,
 actionable research steps.
 
@@ -62,30 +141,64 @@ Topic: {query}
 Return a structured plan.
 """
 
-    response = gemini_model.generate_content(prompt)
+
+def record_usage(response):
+    # Gemini token counts for the active telemetry span
+    usage = getattr(response, "usage_metadata", None)
+    record(llm_calls=1,
+           prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+           completion_tokens=getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def plan_update(response):
+    record_usage(response)
     plan_text = response.text.strip()
 
     print("\n📌 PLAN GENERATED:\n", plan_text)
     print("================ PLANNER AGENT END ==================\n")
 
-    return state | {"plan": plan_text}
+    return {"plan": plan_text}
+
+
+def planner_agent(state):
+    print("\n================ PLANNER AGENT START ================")
+    response = call_scheduler.call("gemini", get_gemini_model().generate_content, planner_prompt(state["user_query"]))
+    return plan_update(response)
+
+
+async def aplanner_agent(state):
+    print("\n================ PLANNER AGENT START ================")
+    response = await call_scheduler.acall("gemini", get_gemini_model().generate_content_async, planner_prompt(state["user_query"]))
+    return plan_update(response)
 
 
 # ============================================================
 # AGENT 2 — SEARCHER (Tavily)
 # ============================================================
 
+RAW_SEARCH_PARAMS = {"search_depth": "advanced", "max_results": 8}
+
+
 def searcher_agent(state):
     print("\n================ SEARCHER AGENT START ================")
 
-    query = state["user_query"]
+    try:
+        results = get_tavily_client().search(query=state["user_query"], **RAW_SEARCH_PARAMS)
+    except Exception as e:
+        print("❌ Tavily Search Error:", e)
+        results = {"results": []}
+
+    print("🔍 Search Results Retrieved!")
+    print("================ SEARCHER AGENT END ==================\n")
+
+    return {"search_results": [results]}
+
+
+async def asearcher_agent(state):
+    print("\n================ SEARCHER AGENT START ================")
 
     try:
-        results = tavily_client.search(
-            query=query,
-            search_depth="advanced",
-            max_results=8
-        )
+        results = await get_async_tavily_client().asearch(query=state["user_query"], **RAW_SEARCH_PARAMS)
     except Exception as e:
         print("❌ Tavily Search Error:", e)
         results = {"results": []}
@@ -93,27 +206,96 @@ def searcher_agent(state):
     print("🔍 Search Results Retrieved!")
     print("================ SEARCHER AGENT END ==================\n")
 
-    return state | {"search_results": results}
+    return {"search_results": [results]}
 
 
 # ============================================================
-# AGENT 3 — WRITER (Gemini)
+# AGENT 2b — FOLLOW-UP SEARCHER (Tavily, plan-derived)
 # ============================================================
 
-def writer_agent(state):
-    print("\n================ WRITER AGENT START =================")
+MAX_FOLLOWUP_SEARCHES = 3
+FOLLOWUP_SEARCH_PARAMS = {"search_depth": "basic", "max_results": 5}
+
+
+def plan_steps(plan_text, limit=MAX_FOLLOWUP_SEARCHES):
+    # Numbered or bulleted lines of the plan, stripped of markdown
+    steps = []
+    for line in plan_text.splitlines():
+        line = line.strip()
+        if not re.match(r"^(\d+[.)]|[-*•])\s+", line):
+            continue
+        step = re.sub(r"^(\d+[.)]|[-*•])\s+", "", line)
+        step = re.sub(r"[*_#`]", "", step).strip(" :")
+        if step:
+            steps.append(step[:120])
+    return steps[:limit]
+
+
+def followup_queries(state):
+    return [f"{state['user_query']} {step}" for step in plan_steps(state["plan"])]
+
+
+def followup_searcher_agent(state):
+    print("\n============ FOLLOW-UP SEARCHER AGENT START ============")
+
+    queries = followup_queries(state)
+
+    def search(q):
+        try:
+            return get_tavily_client().search(query=q, **FOLLOWUP_SEARCH_PARAMS)
+        except Exception as e:
+            print("❌ Tavily Search Error:", e)
+            return {"results": []}
+
+    results = []
+    if queries:
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            futures = [pool.submit(in_context(search), q) for q in queries]
+            results = [future.result() for future in futures]
+
+    print(f"🔍 {len(results)} Plan-Derived Searches Retrieved!")
+    print("============ FOLLOW-UP SEARCHER AGENT END ==============\n")
+
+    return {"search_results": results}
+
+
+async def afollowup_searcher_agent(state):
+    print("\n============ FOLLOW-UP SEARCHER AGENT START ============")
 
+    async def search(q):
+        try:
+            return await get_async_tavily_client().asearch(query=q, **FOLLOWUP_SEARCH_PARAMS)
+        except Exception as e:
+            print("❌ Tavily Search Error:", e)
+            return {"results": []}
+
+    results = list(await asyncio.gather(*(search(q) for q in followup_queries(state))))
+
+    print(f"🔍 {len(results)} Plan-Derived Searches Retrieved!")
+    print("============ FOLLOW-UP SEARCHER AGENT END ==============\n")
+
+    return {"search_results": results}
+
+
+# ============================================================
+# AGENT 3 — WRITER (Gemini)
+# ============================================================
+
+def writer_prompt(state):
     plan = state["plan"]
-    search_json = json.dumps(state["search_results"], indent=2)
+    # Only title/url/snippet of deduplicated sources reach the prompt
+    search_data = compact_search_results(state["search_results"])
+    raw_tokens = count_tokens(json.dumps(state["search_results"], indent=2))
+    print(f"🗜️ Search data: {raw_tokens} → {count_tokens(search_data)} tokens")
 
-    prompt = f"""
+    return f"""
 You are a senior research writer AI.
 
 PLAN:
 {plan}
 
-SEARCH DATA:
-{search_json}
+SEARCH DATA (cite sources by their [number]):
+{search_data}
 
 Write a clear, well-structured research output with:
 
@@ -125,29 +307,52 @@ Write a clear, well-structured research output with:
 Make it crisp, factual, organized, and human-readable.
 """
 
-    response = gemini_model.generate_content(prompt)
+
+def answer_update(response):
+    record_usage(response)
     final_text = response.text.strip()
 
     print("📝 Writer Agent Created Final Report.")
     print("================ WRITER AGENT END ==================\n")
 
-    return state | {"final_answer": final_text}
+    return {"final_answer": final_text}
+
+
+def writer_agent(state):
+    print("\n================ WRITER AGENT START =================")
+    response = call_scheduler.call("gemini", get_gemini_model().generate_content, writer_prompt(state))
+    return answer_update(response)
+
+
+async def awriter_agent(state):
+    print("\n================ WRITER AGENT START =================")
+    response = await call_scheduler.acall("gemini", get_gemini_model().generate_content_async, writer_prompt(state))
+    return answer_update(response)
 
 
 # ============================================================
-# BUILD WORKFLOW (Planner → Searcher → Writer)
+# BUILD WORKFLOW
+#   START → planner → followup_searcher ┐
+#   START → searcher ───────────────────┴→ writer → END
 # ============================================================
 
-workflow = StateGraph(dict)
+workflow = StateGraph(ResearchState)
 
-workflow.add_node("planner", planner_agent)
-workflow.add_node("searcher", searcher_agent)
-workflow.add_node("writer", writer_agent)
+# Each node runs in a telemetry span: wall time, Gemini tokens, searches, cache hits
+for name, func, afunc in [
+    ("planner", planner_agent, aplanner_agent),
+    ("searcher", searcher_agent, asearcher_agent),
+    ("followup_searcher", followup_searcher_agent, afollowup_searcher_agent),
+    ("writer", writer_agent, awriter_agent),
+]:
+    workflow.add_node(name, RunnableLambda(traced(name, func), afunc=traced(name, afunc), name=name))
 
-workflow.set_entry_point("planner")
+# The raw-query search does not need the plan, so it runs alongside planning
+workflow.add_edge(START, "planner")
+workflow.add_edge(START, "searcher")
 
-workflow.add_edge("planner", "searcher")
-workflow.add_edge("searcher", "writer")
+workflow.add_edge("planner", "followup_searcher")
+workflow.add_edge(["searcher", "followup_searcher"], "writer")
 workflow.add_edge("writer", END)
 
 pipeline = workflow.compile()
@@ -163,6 +368,14 @@ def run_pipeline(query):
     return final_state["final_answer"]
 
 
+async def arun_pipeline(query):
+    # Many of these can share one event loop; pipeline_limiter caps them
+    async with pipeline_limiter():
+        state = create_initial_state(query)
+        final_state = await pipeline.ainvoke(state)
+        return final_state["final_answer"]
+
+
 # ============================================================
 # MAIN EXECUTION
 # ============================================================